@@ -1,5 +1,6 @@
 # Escraping things.
-from requests import get
+from requests import get, Session
+from requests.adapters import HTTPAdapter
 from bs4 import BeautifulSoup
 # The schedule page is dynamic, it expects JS, otherwise it doesn't load.
 # We need to use Selenium to scrape it.
@@ -9,39 +10,83 @@ from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.chrome.options import Options
 
 # When things get serious, types come in. To keep the code clean and readable.
-from typing import List, Dict, Optional, Union
+from typing import List, Dict, Optional, Union, NamedTuple, Tuple, Callable, Any, Iterator
 
 # Flask things.
-from flask import Flask, jsonify, request
+from flask import Flask, jsonify, request, Response
+from flask.json.provider import DefaultJSONProvider
 # CORS to allow cross-origin requests. To allow other domains to access the APIs.
 from flask_cors import CORS
 
 # To manipulate times objects.
-from datetime import datetime
-
-from time import sleep
-from threading import Thread, Lock
+from datetime import datetime, date, timedelta, timezone
+
+from time import sleep, monotonic, perf_counter
+from contextlib import contextmanager
+from threading import Thread, Lock, Event, Condition, local
+from concurrent.futures import ThreadPoolExecutor
+import atexit
+from collections import deque
+from random import random
+import cProfile
+import pstats
+import logging
+from logging.handlers import RotatingFileHandler
+from bisect import bisect_left, bisect_right
+import heapq
+from itertools import islice
+from array import array
+from sys import intern, getsizeof, byteorder
 
 # Platform checks.
 from platform import platform
-from os import environ
+from os import environ, path, makedirs, replace
+
+import json
+import re
+from hashlib import sha1
+import sqlite3
+try:
+    # Not available on Windows, there the processes don't coordinate and each one refreshes its own cache.
+    import fcntl
+except ImportError:
+    fcntl = None
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+from html.parser import HTMLParser
+from html import escape
+
+POLES_DATA_URL = environ.get("POLES_DATA_URL", "https://aule.webhost1.unipi.it/poli-didattici/")
 
 # Returns [{pole_name: pole_link}] if the request is successful, otherwise None.
 def fetch_poles_data() -> Optional[List[Dict[str, str]]]:
-    URL = "https://aule.webhost1.unipi.it/poli-didattici/"
+    if SCRAPER_BACKEND == "replay":
+        content = replay_poles_page()
+        return None if content is None else parse_poles_data(content)
+
     page = ""
     try:
-        page = get(URL, timeout=15)
+        with timed(stage_duration, "fetch_poles"):
+            page = get(POLES_DATA_URL, timeout=15)
     except:
         print("Error in web request to fetch poles data.")
         return None
     if page.status_code != 200:
         print("Error in web request to fetch poles data. Wrong status code.")
         return None
-    
-    soup = BeautifulSoup(page.content, 'html.parser')
+
+    if SCRAPE_RECORD_DIR is not None:
+        record_poles_page(page.content)
+    return parse_poles_data(page.content)
+
+# Returns the poles listed in the poles page, [{pole_name: pole_link}].
+# None if the page doesn't have the expected structure.
+def parse_poles_data(content) -> Optional[List[Dict[str, str]]]:
+    soup = BeautifulSoup(content, 'html.parser')
 
     box = soup.find('div', class_='entry-content')
+    if box is None:
+        print("Error in parsing poles data. Unexpected page structure.")
+        return None
 
     poles: List[Dict[str, str]] = []
     for pole in box.find_all('li'):
@@ -54,54 +99,556 @@ def fetch_poles_data() -> Optional[List[Dict[str, str]]]:
 
     return poles
 
-# From the pole link get with selenium the schedule page source content as str.
-def selenium_get_schedule_page(pole_link, get_data_from_cache = True) -> Optional[str]:
-    global src_schedules_page_cache
-    if get_data_from_cache:
-        with cache_lock:
-            cached = src_schedules_page_cache.get(pole_link)
-        if cached is not None:
-            return cached
+# A JSON response body rendered once, when the data behind it changes, and served as is to all the requests.
+class RenderedResponse(NamedTuple):
+    body: bytes
+    etag: str
+    # UTC.
+    last_modified: datetime
+
+# modified_at is when the data behind the response changed (local time), so it is the same in all the workers and
+# across the restarts. Now if not given.
+def render_json(payload, modified_at: Optional[datetime] = None) -> RenderedResponse:
+    # Same output of jsonify.
+    with timed(stage_duration, "serialize"):
+        body = (json.dumps(payload, sort_keys = True, separators = (",", ":")) + "\n").encode("utf-8")
+    last_modified = datetime.now(timezone.utc) if modified_at is None else modified_at.astimezone(timezone.utc)
+    return RenderedResponse(body, sha1(body).hexdigest(), last_modified)
+
+# Poles directory cache, so that the request handlers never wait for the poles page web request.
+# It is refreshed by the cache thread and, when older than the TTL, in background by the first request that sees it stale.
+POLES_DIRECTORY_TTL_SECONDS = int(environ.get("POLES_DIRECTORY_TTL_SECONDS", "3600"))
+# How long a request waits for the very first poles fetch when the service has just started.
+POLES_DIRECTORY_FIRST_LOAD_TIMEOUT_SECONDS = 20
+
+class PolesDirectory(NamedTuple):
+    # As returned by fetch_poles_data, [{pole_name: pole_link}].
+    poles: List[Dict[str, str]]
+    # Normalized pole name -> pole link.
+    index: Dict[str, str]
+    # Sorted normalized pole names, used for the prefix lookups.
+    sorted_names: List[str]
+    fetched_at: datetime
+    # The /api/poles_data response.
+    response: RenderedResponse
+
+poles_directory: Optional[PolesDirectory] = None
+poles_directory_lock = Lock()
+poles_directory_loaded = Event()
+poles_directory_refreshing = False
+
+# Lowercase, trimmed and with single spaces, so "Polo  Fibonacci " and "polo fibonacci" are the same pole.
+def normalize_pole_name(pole_name) -> str:
+    return " ".join(pole_name.lower().split())
+
+def build_poles_directory(poles, fetched_at = None) -> PolesDirectory:
+    index: Dict[str, str] = {}
+    for pole in poles:
+        for pole_name, pole_link in pole.items():
+            # The first pole with a given name wins.
+            index.setdefault(normalize_pole_name(pole_name), pole_link)
+    if fetched_at is None:
+        fetched_at = datetime.now()
+    return PolesDirectory(poles, index, sorted(index.keys()), fetched_at, render_json({"poles_data": poles}, fetched_at))
+
+# Fetches the poles and swaps the directory. On failure the previous directory is kept and None is returned.
+def refresh_poles_directory() -> Optional[PolesDirectory]:
+    poles = fetch_poles_data()
+    if poles is None:
+        return None
+    return update_poles_directory(poles)
+
+def update_poles_directory(poles) -> PolesDirectory:
+    directory = build_poles_directory(poles)
+    swap_poles_directory(directory)
+    save_poles_directory_to_store(directory)
+    return directory
+
+def swap_poles_directory(directory: PolesDirectory):
+    global poles_directory
+    with poles_directory_lock:
+        poles_directory = directory
+    poles_directory_loaded.set()
+
+# Starts a background refresh of the poles directory, unless one is already running.
+def refresh_poles_directory_in_background():
+    global poles_directory_refreshing
+    with poles_directory_lock:
+        if poles_directory_refreshing:
+            return
+        poles_directory_refreshing = True
+
+    def refresh():
+        global poles_directory_refreshing
+        try:
+            refresh_poles_directory()
+        finally:
+            with poles_directory_lock:
+                poles_directory_refreshing = False
+
+    Thread(target = refresh, daemon = True).start()
+
+# Returns the cached poles directory (stale-while-revalidate), None if the poles were never fetched successfully.
+def get_poles_directory() -> Optional[PolesDirectory]:
+    with poles_directory_lock:
+        directory = poles_directory
+
+    if directory is None:
+        # Just started, waiting for the first fetch (or the first load from the shared store) instead of making
+        # another web request.
+        if is_refresher:
+            refresh_poles_directory_in_background()
+        with timed(stage_duration, "poles_wait"):
+            poles_directory_loaded.wait(POLES_DIRECTORY_FIRST_LOAD_TIMEOUT_SECONDS)
+        with poles_directory_lock:
+            return poles_directory
+
+    if is_refresher and (datetime.now() - directory.fetched_at).total_seconds() > POLES_DIRECTORY_TTL_SECONDS:
+        refresh_poles_directory_in_background()
+
+    return directory
+
+# Returns the link of the pole matching the given name, first by exact name, then by prefix, then by substring.
+# None if no pole matches.
+def resolve_pole_link(directory: PolesDirectory, pole_name) -> Optional[str]:
+    name = normalize_pole_name(pole_name)
+    if name == "":
+        return None
+
+    pole_link = directory.index.get(name)
+    if pole_link is not None:
+        return pole_link
+
+    i = bisect_left(directory.sorted_names, name)
+    if i < len(directory.sorted_names) and directory.sorted_names[i].startswith(name):
+        return directory.index[directory.sorted_names[i]]
+
+    for candidate in directory.sorted_names:
+        if name in candidate:
+            return directory.index[candidate]
+
+    return None
 
+# Scraping backend:
+# "selenium" renders every schedule page in Chrome and parses the DOM.
+# "feed" captures with Selenium, once, the JSON events feed the calendar loads and then downloads it directly
+# with plain web requests, going back to Selenium when the feed doesn't respect anymore what was captured.
+# "replay" reads the poles page and the schedule pages from a recording (SCRAPE_REPLAY_DIR, see RECORD AND REPLAY).
+# "http" downloads the schedule pages with plain web requests, from a stand-in of the university website serving
+# them already rendered (replay_server.py, with POLES_DATA_URL pointing to it).
+SCRAPER_BACKEND = environ.get("SCRAPER_BACKEND", "selenium")
+
+# Launches a new headless Chrome driver.
+def new_chrome_driver():
     # Chrome options.
     chrome_options = Options()
     chrome_options.add_argument("--headless")
     chrome_options.add_argument("--disable-gpu")
     chrome_options.add_argument("--no-sandbox")
+    if SCRAPER_BACKEND == "feed":
+        # Needed to find the calendar events feed between the requests made by the page.
+        chrome_options.set_capability("goog:loggingPrefs", {"performance": "ALL"})
+
+    service = ""
+    if "linux" in str(platform()).lower():
+        # Passing the path to the chromedriver to use it on my linux arm server.
+        service = Service(environ.get("CHROMEDRIVER_PATH"))
+    else:
+        service = Service(ChromeDriverManager().install())
+
+    # Selenium driver setup.
+    return webdriver.Chrome(service = service, options = chrome_options)
+
+# A driver of the pool with its usage counters.
+class PooledDriver:
+    def __init__(self, driver):
+        self.driver = driver
+        self.pages = 0
+        self.last_used = monotonic()
+
+# Bounded pool of long-lived Chrome drivers, so that a scrape only costs the page navigation and not a browser launch.
+# A driver is recycled (quitted and replaced by a new one when needed) after max_pages pages, after being idle
+# for more than max_idle_seconds or when it crashes.
+class DriverPool:
+    def __init__(self, max_size, max_pages, max_idle_seconds):
+        self.max_size = max_size
+        self.max_pages = max_pages
+        self.max_idle_seconds = max_idle_seconds
+        self.condition = Condition()
+        self.idle: List[PooledDriver] = []
+        # Alive drivers, idle and in use.
+        self.size = 0
+        self.launches = 0
+        self.launch_failures = 0
+        self.recycles = 0
+        self.crashes = 0
+        self.pages = 0
+
+    # Returns a driver, launching a new one if none is idle and the pool is not full, otherwise waits for one.
+    # Returns None if the launch fails or the timeout expires.
+    def acquire(self, timeout = None) -> Optional[PooledDriver]:
+        expired: List[PooledDriver] = []
+        pooled = None
+        with self.condition:
+            # Dropping the drivers unused for too long, they only hold memory.
+            now = monotonic()
+            for idle in list(self.idle):
+                if now - idle.last_used > self.max_idle_seconds:
+                    self.idle.remove(idle)
+                    self.size -= 1
+                    self.recycles += 1
+                    expired.append(idle)
+
+            if not self.condition.wait_for(lambda: len(self.idle) > 0 or self.size < self.max_size, timeout):
+                pooled = None
+            elif len(self.idle) > 0:
+                pooled = self.idle.pop()
+            else:
+                # Reserving the slot, the launch happens outside the lock.
+                self.size += 1
+                self.launches += 1
+                pooled = PooledDriver(None)
+
+        for idle in expired:
+            self.quit(idle)
+
+        if pooled is not None and pooled.driver is None:
+            try:
+                pooled.driver = new_chrome_driver()
+            except Exception as e:
+                print(f"Selenium driver launch error: {e}")
+                with self.condition:
+                    self.size -= 1
+                    self.launch_failures += 1
+                    self.condition.notify()
+                return None
+
+        return pooled
+
+    # Gives back a driver to the pool, broken drivers (an exception happened while using them) are quitted.
+    def release(self, pooled: PooledDriver, broken = False):
+        pooled.pages += 1
+        pooled.last_used = monotonic()
+        with self.condition:
+            self.pages += 1
+            recycle = broken or pooled.pages >= self.max_pages
+            if recycle:
+                self.size -= 1
+                if broken:
+                    self.crashes += 1
+                else:
+                    self.recycles += 1
+            else:
+                self.idle.append(pooled)
+            self.condition.notify()
+
+        if recycle:
+            self.quit(pooled)
+
+    def quit(self, pooled: PooledDriver):
+        try:
+            pooled.driver.quit()
+        except:
+            pass
+
+    # Quits all the idle drivers.
+    def close(self):
+        with self.condition:
+            idle = self.idle
+            self.idle = []
+            self.size -= len(idle)
+        for pooled in idle:
+            self.quit(pooled)
+
+    def stats(self) -> Dict[str, int]:
+        with self.condition:
+            return {
+                "max_size": self.max_size,
+                "alive": self.size,
+                "idle": len(self.idle),
+                "in_use": self.size - len(self.idle),
+                "launches": self.launches,
+                "launch_failures": self.launch_failures,
+                "recycles": self.recycles,
+                "crashes": self.crashes,
+                "pages": self.pages,
+            }
+
+driver_pool = DriverPool(
+    max_size = int(environ.get("DRIVER_POOL_SIZE", "2")),
+    max_pages = int(environ.get("DRIVER_MAX_PAGES", "50")),
+    # Longer than the cache refresh period, so the drivers stay warm between two refreshes.
+    max_idle_seconds = int(environ.get("DRIVER_MAX_IDLE_SECONDS", "1200")),
+)
+# Not leaving orphan Chrome processes around.
+atexit.register(driver_pool.close)
+# How long a scrape waits for a driver when all of them are in use.
+DRIVER_ACQUIRE_TIMEOUT_SECONDS = float(environ.get("DRIVER_ACQUIRE_TIMEOUT_SECONDS", "120"))
+
+# Upper bound of the wait for the schedule page to be rendered.
+SCRAPER_WAIT_TIMEOUT_SECONDS = float(environ.get("SCRAPER_WAIT_TIMEOUT_SECONDS", "15"))
+# The page is considered rendered when the calendar tables content doesn't change for this long.
+SCRAPER_STABLE_SECONDS = float(environ.get("SCRAPER_STABLE_SECONDS", "0.5"))
+SCRAPER_POLL_SECONDS = 0.1
+
+# Returns the number of classrooms rows and of schedules in the calendar tables, None if the tables are not there yet
+# or the page is still loading something (FullCalendar loads the events with jQuery ajax requests).
+CALENDAR_STATE_SCRIPT = """
+if (document.readyState !== "complete") return null;
+if (window.jQuery && window.jQuery.active > 0) return null;
+var resources = document.querySelector("td.fc-resource-area.fc-widget-content");
+var times = document.querySelector("td.fc-time-area.fc-widget-content");
+if (resources === null || times === null) return null;
+return [resources.querySelectorAll("td.fc-widget-content").length, times.querySelectorAll("a").length];
+"""
+
+# pole_link -> {"last": seconds, "max": seconds, "timeouts": n}, how long the scraper waited the page rendering.
+scrape_wait_times: Dict[str, Dict[str, float]] = {}
+scrape_wait_times_lock = Lock()
+
+# Waits until the FullCalendar tables are in the page and stable, at most SCRAPER_WAIT_TIMEOUT_SECONDS.
+# Returns True if the page is ready, False if the timeout expired.
+def wait_schedule_page_ready(driver, pole_link) -> bool:
+    start = monotonic()
+    last_state = None
+    stable_since = start
+    ready = False
+    while True:
+        now = monotonic()
+        state = driver.execute_script(CALENDAR_STATE_SCRIPT)
+        if state is None or state != last_state or state[0] == 0:
+            last_state = state
+            stable_since = now
+        elif now - stable_since >= SCRAPER_STABLE_SECONDS:
+            ready = True
+            break
+        if now - start >= SCRAPER_WAIT_TIMEOUT_SECONDS:
+            break
+        sleep(SCRAPER_POLL_SECONDS)
+
+    waited = monotonic() - start
+    with scrape_wait_times_lock:
+        times = scrape_wait_times.setdefault(pole_link, {"last": 0.0, "max": 0.0, "timeouts": 0})
+        times["last"] = round(waited, 3)
+        times["max"] = max(times["max"], times["last"])
+        if not ready:
+            times["timeouts"] += 1
+    return ready
+
+# Moves the calendar to the given day (the page shows today) and returns the day shown.
+GOTO_DATE_SCRIPT = """
+var calendar = window.jQuery && window.jQuery(".fc").first();
+if (!calendar || calendar.length === 0) return null;
+calendar.fullCalendar("gotoDate", arguments[0]);
+return calendar.fullCalendar("getDate").format("YYYY-MM-DD");
+"""
+
+# From the pole link get with selenium the schedule page source content as str, of the given day (default today).
+def selenium_get_schedule_page(pole_link, get_data_from_cache = True, day: Optional[date] = None) -> Optional[str]:
+    if day is None:
+        day = date.today()
+    if get_data_from_cache:
+        with cache_lock:
+            cached = src_schedules_page_cache.get((pole_link, day))
+        if cached is not None:
+            return cached
+
+    pooled = driver_pool.acquire(DRIVER_ACQUIRE_TIMEOUT_SECONDS)
+    if pooled is None:
+        print(f"Selenium error for {pole_link}: no driver available.")
+        return None
 
-    driver = None
+    broken = False
     try:
-        service = ""
-        if "linux" in str(platform()).lower():
-            # Passing the path to the chromedriver to use it on my linux arm server.
-            service = Service(environ.get("CHROMEDRIVER_PATH"))
-        else:
-            service = Service(ChromeDriverManager().install())
+        driver = pooled.driver
 
-        # Selenium driver setup.
-        driver = webdriver.Chrome(service = service, options = chrome_options)
+        if SCRAPER_BACKEND == "feed":
+            # Dropping the network logs of the previous page.
+            driver.get_log("performance")
 
         driver.get(pole_link)
 
-        # Not beautiful but I cannot make it works in async way due to JS execution used to fill the page.
-        sleep(5)
+        # The page is filled by JS, waiting for the calendar to be rendered.
+        if not wait_schedule_page_ready(driver, pole_link):
+            # Taking it anyway, the parser rejects it if the tables are not complete.
+            print(f"Selenium timeout waiting the schedule page of {pole_link}.")
+
+        if day != date.today():
+            if driver.execute_script(GOTO_DATE_SCRIPT, day.isoformat()) != day.isoformat():
+                print(f"Selenium error for {pole_link}: cannot show the schedules of {day.isoformat()}.")
+                return None
+            if not wait_schedule_page_ready(driver, pole_link):
+                print(f"Selenium timeout waiting the schedule page of {pole_link} on {day.isoformat()}.")
 
         page_source = str(driver.page_source)
+        if SCRAPE_RECORD_DIR is not None:
+            record_schedule_page(pole_link, day, page_source)
 
-        # Update cache.
-        with cache_lock:
-            src_schedules_page_cache[pole_link] = page_source
+        if SCRAPER_BACKEND == "feed" and day == date.today() and get_feed_contract(pole_link) is None:
+            capture_feed_contract(driver, pole_link, page_source)
 
+        # The cache is updated by the caller (update_pole_cache), together with the parsed model.
         return page_source
     except Exception as e:
         print(f"Selenium error for {pole_link}: {e}")
+        broken = True
         return None
     finally:
-        try:
-            if driver is not None:
-                driver.quit()
-        except:
-            pass
+        driver_pool.release(pooled, broken)
+
+# Elements without the closing tag.
+VOID_ELEMENTS = {"area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "param", "source", "track", "wbr"}
+
+# A <span> inside a schedule's <a> tag, while it is being read.
+class OpenSpan:
+    def __init__(self, slot):
+        # Position of the span in its <a> tag (the spans are joined in document order, but closed in reverse).
+        self.slot = slot
+        # Inner HTML, as BeautifulSoup's decode_contents would produce it.
+        self.contents: List[str] = []
+        self.text: List[str] = []
+        self.has_br = False
+
+# Single pass tokenizer of the schedule page.
+# It only looks inside the two FullCalendar tables and collects, while reading, the classrooms' names,
+# the rows' ids and, for each <a> tag, its row id and its text with each <br> row delimited by an '|'.
+class SchedulePageParser(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs = True)
+        # Number of open elements.
+        self.depth = 0
+
+        # Depth of the open td of the first table, None before it, -1 after it.
+        self.resource_area_depth: Optional[int] = None
+        # Text of the classrooms' rows (td.fc-widget-content) and the indexes of the ones open.
+        self.classrooms_texts: List[List[str]] = []
+        self.open_classrooms: List[Tuple[int, int]] = []
+
+        # Depth of the open td of the second table, None before it, -1 after it.
+        self.time_area_depth: Optional[int] = None
+        # Depth of the first <table> inside the second table's td, None before it, -1 after it.
+        self.rows_table_depth: Optional[int] = None
+        self.rows_ids: List[str] = []
+        # Open <tr> tags, (depth, data-resource-id).
+        self.open_trs: List[Tuple[int, Optional[str]]] = []
+
+        # The <a> tag being read, its row id and its spans.
+        self.a_depth: Optional[int] = None
+        self.a_row_id: Optional[str] = None
+        self.a_pieces: List[str] = []
+        self.open_spans: List[Tuple[int, OpenSpan]] = []
+        # (row id, parsed text) of each <a> tag.
+        self.schedules: List[Tuple[Optional[str], str]] = []
+
+    def handle_starttag(self, tag, attrs):
+        self.handle_tag(tag, attrs)
+        if tag not in VOID_ELEMENTS:
+            self.depth += 1
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_tag(tag, attrs)
+
+    def handle_tag(self, tag, attrs):
+        # Elements are closed at this depth.
+        depth = self.depth
+
+        if self.open_spans:
+            if tag == "br":
+                for _, span in self.open_spans:
+                    span.has_br = True
+                    span.contents.append("<br/>")
+            else:
+                serialized = "<" + tag + "".join(f' {key}="{escape(value or "")}"' for key, value in attrs)
+                serialized += "/>" if tag in VOID_ELEMENTS else ">"
+                for _, span in self.open_spans:
+                    span.contents.append(serialized)
+
+        if tag == "td":
+            classes = dict(attrs).get("class") or ""
+            if self.resource_area_depth is None and classes == "fc-resource-area fc-widget-content":
+                self.resource_area_depth = depth
+                return
+            if self.time_area_depth is None and classes == "fc-time-area fc-widget-content":
+                self.time_area_depth = depth
+                return
+            if self.in_resource_area() and "fc-widget-content" in classes.split():
+                self.open_classrooms.append((depth, len(self.classrooms_texts)))
+                self.classrooms_texts.append([])
+            return
+
+        if tag == "tr":
+            row_id = dict(attrs).get("data-resource-id")
+            self.open_trs.append((depth, row_id))
+            if self.in_rows_table():
+                if row_id is None:
+                    raise ValueError("Schedules row without data-resource-id.")
+                self.rows_ids.append(row_id)
+            return
+
+        if not self.in_time_area():
+            return
+
+        if tag == "table" and self.rows_table_depth is None:
+            self.rows_table_depth = depth
+        elif tag == "a" and self.a_depth is None:
+            self.a_depth = depth
+            # The nearest <tr> is the schedule's row.
+            if not self.open_trs or self.open_trs[-1][1] is None:
+                raise ValueError("Schedule outside of a row with data-resource-id.")
+            self.a_row_id = self.open_trs[-1][1]
+        elif tag == "span" and self.a_depth is not None and tag not in VOID_ELEMENTS:
+            self.open_spans.append((depth, OpenSpan(len(self.a_pieces))))
+            self.a_pieces.append("")
+
+    def handle_endtag(self, tag):
+        if tag in VOID_ELEMENTS:
+            return
+        self.depth -= 1
+        depth = self.depth
+
+        if self.open_spans and self.open_spans[-1][0] == depth:
+            _, span = self.open_spans.pop()
+            if span.has_br:
+                content = "".join(span.contents)
+                lines = [line.strip().replace("\t", "") for line in content.split("<br/>") if line.strip()]
+                self.a_pieces[span.slot] = "|".join(lines)
+            else:
+                self.a_pieces[span.slot] = "".join(span.text) + "|"
+        for _, span in self.open_spans:
+            span.contents.append(f"</{tag}>")
+
+        if self.a_depth == depth:
+            self.schedules.append((self.a_row_id, "".join(self.a_pieces).replace("&amp;", "")))
+            self.a_depth = None
+            self.a_pieces = []
+        if self.open_classrooms and self.open_classrooms[-1][0] == depth:
+            self.open_classrooms.pop()
+        if self.open_trs and self.open_trs[-1][0] == depth:
+            self.open_trs.pop()
+        if self.rows_table_depth == depth:
+            self.rows_table_depth = -1
+        if self.resource_area_depth == depth:
+            self.resource_area_depth = -1
+        if self.time_area_depth == depth:
+            self.time_area_depth = -1
+
+    def handle_data(self, data):
+        for _, index in self.open_classrooms:
+            self.classrooms_texts[index].append(data)
+        if self.open_spans:
+            escaped = escape(data, quote = False)
+            for _, span in self.open_spans:
+                span.text.append(data)
+                span.contents.append(escaped)
+
+    def in_resource_area(self) -> bool:
+        return self.resource_area_depth is not None and self.resource_area_depth >= 0
+
+    def in_time_area(self) -> bool:
+        return self.time_area_depth is not None and self.time_area_depth >= 0
+
+    def in_rows_table(self) -> bool:
+        return self.in_time_area() and self.rows_table_depth is not None and self.rows_table_depth >= 0
 
 # Returns an "infos" list, with the following structure:
 # [
@@ -109,228 +656,1240 @@ def selenium_get_schedule_page(pole_link, get_data_from_cache = True) -> Optiona
 #   ...
 # ]
 # Where scheduleN is all the plain text in the <a> tag as str with each <br> row delimited by an '|'.
+# None if the page doesn't have the expected structure.
 def escrape_schedule_page(schedule_page_source) -> Optional[List[Dict[str, Union[str, List[str]]]]]:
 
-    soup = BeautifulSoup(schedule_page_source, 'html.parser')
-
     # The page is divided in two parts (tables).
     # The first one is a table with as rows the classrooms, each table row has a classroom's name.
     # The second one is a table with as rows the schedules.
 
     # The schedules could be from 0 to n. 0 means the classroom is free all day.
-    # Since the content of interest is divided in two tables, we need to iterate over both of them and match the classrooms with the schedules manually.
+    # Since the content of interest is divided in two tables, the rows of the second one are matched with the classrooms
+    # by position, while each schedule is matched with its row by the data-resource-id of the <tr> containing it.
 
     # ATTENTION: BE CAREFUL, NOT ALL POLES PAGE HAVE THE SAME STRUCTURE, SO BE AS GENERIC AS POSSIBLE.
 
-    # [
-    #   {"Classroom": "classroom_name", "RESOURCE_ID_ROW_DYNAMIC": ["schedule1", "schedule2", ...]},
-    #   ...
-    # ]
-    # Where scheduleN is all the plain text in the <a> tag as str with each <br> row delimited by an '|'.
-    infos: List[Dict[str, Union[str, List[str]]]] = []
+    parser = SchedulePageParser()
+    try:
+        parser.feed(schedule_page_source)
+        parser.close()
+    except ValueError as e:
+        print(f"Unexpected schedule page structure: {e}")
+        return None
 
-    # Iterating over the first table to get the classrooms.
-    first_table = soup.find_all("td", class_=["fc-resource-area fc-widget-content"])[0]
-    rows_first = first_table.find_all("td", class_=["fc-widget-content"])
-
-    # List of classrooms' names as str.
-    classrooms: List[str] = []
-    for row in rows_first:
-        # Sanitizing the classroom name.
-        classroom = row.text.split("(")[0].strip()
-        classrooms.append(classroom)
-
-    # Getting second table's data.
-    second_table = soup.find_all("td", class_=["fc-time-area fc-widget-content"])[0]
-    all_schedules_a = second_table.find_all("a")
-    parsed_a = ""
-    all_parsed_a = []
-    for a in all_schedules_a:
-        spans = a.find_all("span")
-        for s in spans:
-            brs = s.find_all("br")
-            if len(brs) > 0:
-                content = s.decode_contents()
-                lines = [line.strip().replace("\t", "") for line in content.split("<br/>") if line.strip()]
-                parsed_a += "|".join(lines)
-            else:
-                parsed_a += s.text + "|"
+    if parser.resource_area_depth is None or parser.time_area_depth is None:
+        return None
 
-        all_parsed_a.append(parsed_a)
-        parsed_a = ""
-    rows_second = second_table.find_all("table")[0].find_all("tr")
+    # Sanitizing the classrooms' names.
+    classrooms = ["".join(text).split("(")[0].strip() for text in parser.classrooms_texts]
 
     # DANGER IF THE TABLES ARE NOT IN SYNC.
-    if len(rows_first) != len(rows_second):
+    if len(classrooms) != len(parser.rows_ids):
         return None
 
-    # Getting rows' ids, used to join the classrooms with the schedules.
-    # data-resource-id is an attribute of the <tr> tag.
-    rows_ids = []
-    for row in rows_second:
-        rows_ids.append(row['data-resource-id'])
+    schedules_by_row: Dict[str, List[str]] = {}
+    for row_id, schedule in parser.schedules:
+        schedules_by_row.setdefault(row_id, []).append(schedule)
 
-    # Getting schedules.
-    # list_of_schedules is the final list.
-    list_of_schedules = []
-    current_row_id = ""
-    # current_row_schedules is a TEMPORARY list of schedules of the current row.
-    current_row_schedules = []
-    # Adding a None to the end to process the last row, otherwise it will be skipped wrongly.
-    for schedule_a in list(all_schedules_a) + [None]:
+    # Joining all the infos.
+    infos: List[Dict[str, Union[str, List[str]]]] = []
+    for classroom, row_id in zip(classrooms, parser.rows_ids):
+        info = {}
+        info["Classroom"] = classroom
+        info[row_id] = schedules_by_row.get(row_id, [])
+        infos.append(info)
 
-        if schedule_a is None:
-            # Last iteration.
-            # current_row_schedules is not empty, setted in the previous iteration.
-            info = {}
-            info[current_row_id] = current_row_schedules.copy()
+    return infos
 
-            list_of_schedules.append(info)
+# Typed records of a pole's parsed schedules.
+# They are built once, when the cache is refreshed, and then only read by the request handlers.
+# Schedule is not stored, the queries build it on demand from the pole's ScheduleTable.
+class Schedule(NamedTuple):
+    # All the plain text of the schedule, rows delimited by an '|' (as produced by escrape_schedule_page).
+    text: str
+    # "HH:MM" strings.
+    start: str
+    end: str
+    # Minutes from midnight.
+    start_minutes: int
+    end_minutes: int
+
+# All the schedules of a pole in parallel arrays, classroom after classroom, each classroom in the page order.
+# The texts are one string, the schedule i is texts[text_offsets[i]:text_offsets[i + 1]]. Sorting each classroom's
+# schedules by start gives sorted_indexes, with their starts and running max ends at the same positions, so that
+# "is it free at minute m", "which schedule is at minute m" and "when is the next schedule after minute m" are binary
+# searches in the classroom's range of positions.
+class ScheduleTable:
+    __slots__ = ("texts", "text_offsets", "starts", "ends", "sorted_indexes", "sorted_starts", "ends_max")
+
+    # Name and typecode of the arrays, in the serialization order (see serialize_pole_schedules).
+    ARRAYS = (("text_offsets", "I"), ("starts", "H"), ("ends", "H"), ("sorted_indexes", "I"), ("sorted_starts", "H"), ("ends_max", "H"))
+
+    def __init__(self, texts: str, text_offsets: array, starts: array, ends: array, sorted_indexes: array, sorted_starts: array, ends_max: array):
+        self.texts = texts
+        self.text_offsets = text_offsets
+        # Minutes from midnight.
+        self.starts = starts
+        self.ends = ends
+        self.sorted_indexes = sorted_indexes
+        self.sorted_starts = sorted_starts
+        # ends_max[p] is the latest end among the classroom's sorted positions up to p, if it is before m no schedule
+        # started by m is running.
+        self.ends_max = ends_max
+
+    def __len__(self):
+        return len(self.starts)
+
+    def text(self, i) -> str:
+        return self.texts[self.text_offsets[i]:self.text_offsets[i + 1]]
+
+    def schedule(self, i) -> Schedule:
+        return Schedule(self.text(i), format_minutes(self.starts[i]), format_minutes(self.ends[i]), self.starts[i], self.ends[i])
+
+# A classroom is its range [first, last) in the pole's ScheduleTable, the names are interned (the same in all the days).
+class Classroom:
+    __slots__ = ("name", "resource_id", "table", "first", "last")
+
+    def __init__(self, name, resource_id, table: ScheduleTable, first, last):
+        self.name = intern(name)
+        self.resource_id = intern(resource_id)
+        self.table = table
+        self.first = first
+        self.last = last
+
+    def schedules_count(self) -> int:
+        return self.last - self.first
+
+    # The schedules' texts in the page order.
+    def texts(self) -> List[str]:
+        return [self.table.text(i) for i in range(self.first, self.last)]
+
+# Free until value of the classrooms free until the end of the day, after all the minutes.
+FREE_UNTIL_END_OF_DAY = 0xFFFF
+
+# The free classrooms of the pole for every slot of the day, sorted by how long they stay free, so that the free
+# classrooms at a minute, and the ones free for at least n minutes, are a binary search and a prefix.
+# The free classrooms only change at the boundaries (see PoleSchedules.boundaries), with b0 < b1 < ... the slots are:
+# before b0, at b0, between b0 and b1, at b1, ..., after the last one (a schedule is running at its start and end minutes).
+# The free classrooms of slot x are classrooms[slot_offsets[x]:slot_offsets[x + 1]], indexes in PoleSchedules.classrooms,
+# each free until the start of its next schedule, free_until at the same positions, in decreasing order.
+class FreeRoomsIndex:
+    __slots__ = ("slot_offsets", "classrooms", "free_until")
+
+    def __init__(self, slot_offsets: array, classrooms: array, free_until: array):
+        self.slot_offsets = slot_offsets
+        self.classrooms = classrooms
+        self.free_until = free_until
+
+class PoleSchedules(NamedTuple):
+    pole_link: str
+    # Day of the schedules.
+    day: date
+    classrooms: List[Classroom]
+    # Lowercased classroom name -> Classroom, used to lookup a room without scanning the whole pole.
+    classrooms_by_name: Dict[str, Classroom]
+    updated_at: datetime
+    # The /api/get_all_rooms_given_pole response.
+    all_rooms_response: RenderedResponse
+    # Minute of the day -> /api/free_classrooms_now_given_pole response, only the current minute is kept.
+    free_now_responses: Dict[int, RenderedResponse]
+    # Hash of the schedules the model was built from (see infos_fingerprint), a refresh with the same hash changes nothing.
+    fingerprint: str
+    # Sorted minutes of the day when a schedule starts or ends, the only ones when the free classrooms can change.
+    boundaries: array
+    table: ScheduleTable
+    free_rooms: FreeRoomsIndex
+
+# From the schedule page source builds the PoleSchedules model, returns None if the page cannot be parsed.
+def build_pole_schedules(pole_link, schedule_page_source, day: Optional[date] = None, updated_at: Optional[datetime] = None) -> Optional[PoleSchedules]:
+    try:
+        infos = escrape_schedule_page(schedule_page_source)
+    except Exception as e:
+        print(f"Parsing error for {pole_link}: {e}")
+        return None
+    if infos is None:
+        return None
 
-            current_row_schedules.clear()
+    return build_pole_schedules_from_infos(pole_link, infos, updated_at, day)
+
+# "HH:MM" -> minutes from midnight, raises ValueError if it is not a valid time.
+def parse_minutes(hhmm) -> int:
+    hours, minutes = hhmm.split(":")
+    hours = int(hours)
+    minutes = int(minutes)
+    # "24:00" is the end of the day.
+    if not ((0 <= hours < 24 and 0 <= minutes < 60) or (hours == 24 and minutes == 0)):
+        raise ValueError(f"Invalid time '{hhmm}'.")
+    return hours * 60 + minutes
+
+# Minutes from midnight -> "HH:MM".
+def format_minutes(minutes) -> str:
+    return f"{int(minutes) // 60:02d}:{int(minutes) % 60:02d}"
+
+# Minutes from midnight of the given time, with the seconds as fraction (schedules end at HH:MM:00).
+def minutes_of_day(time: datetime) -> float:
+    return time.hour * 60 + time.minute + time.second / 60
+
+# From an "infos" list (see escrape_schedule_page) builds the PoleSchedules model, None if a schedule is malformed.
+def build_pole_schedules_from_infos(pole_link, infos, updated_at = None, day: Optional[date] = None) -> Optional[PoleSchedules]:
+    texts: List[str] = []
+    starts = array("H")
+    ends = array("H")
+    # [(name, resource_id, schedules count)]
+    classrooms: List[Tuple[str, str, int]] = []
+    for info in infos:
+        resource_id = list(info.keys())[1]
+        for text in info[resource_id]:
+            timestartend = text.split("|")[0].split("-")
+            try:
+                if len(timestartend) != 2:
+                    raise ValueError("No start and end time.")
+                start = parse_minutes(timestartend[0].strip())
+                end = parse_minutes(timestartend[1].strip())
+            except ValueError:
+                print(f"Parsing error for {pole_link}: unexpected schedule '{text}'.")
+                return None
+            texts.append(text)
+            starts.append(start)
+            ends.append(end)
+        classrooms.append((info["Classroom"], resource_id, len(info[resource_id])))
+
+    text_offsets = array("I", [0])
+    for text in texts:
+        text_offsets.append(text_offsets[-1] + len(text))
+    sorted_indexes = array("I")
+    sorted_starts = array("H")
+    ends_max = array("H")
+    first = 0
+    for name, resource_id, count in classrooms:
+        end_max = 0
+        # Stable, the schedules with the same start keep the page order.
+        for i in sorted(range(first, first + count), key = starts.__getitem__):
+            end_max = max(end_max, ends[i])
+            sorted_indexes.append(i)
+            sorted_starts.append(starts[i])
+            ends_max.append(end_max)
+        first += count
+
+    table = ScheduleTable("".join(texts), text_offsets, starts, ends, sorted_indexes, sorted_starts, ends_max)
+    return build_pole_schedules_from_table(pole_link, day, updated_at, infos_fingerprint(infos), classrooms, table)
+
+# Builds the PoleSchedules model around its ScheduleTable, classrooms is [(name, resource_id, schedules count)] in
+# the table order.
+def build_pole_schedules_from_table(pole_link, day: Optional[date], updated_at: Optional[datetime], fingerprint, classrooms: List[Tuple[str, str, int]], table: ScheduleTable) -> PoleSchedules:
+    classrooms_list: List[Classroom] = []
+    classrooms_by_name: Dict[str, Classroom] = {}
+    first = 0
+    for name, resource_id, count in classrooms:
+        classroom = Classroom(name, resource_id, table, first, first + count)
+        first += count
+        classrooms_list.append(classroom)
+        # Same as the old linear scan, the first classroom with a given name wins.
+        classrooms_by_name.setdefault(classroom.name.lower(), classroom)
+
+    if updated_at is None:
+        updated_at = datetime.now()
+    if day is None:
+        day = date.today()
+    all_rooms_response = render_json({"all_rooms": [classroom.name for classroom in classrooms_list]}, updated_at)
+    boundaries = array("H", sorted(set(table.starts) | set(table.ends)))
+    free_rooms = build_free_rooms_index(classrooms_list, boundaries)
+    return PoleSchedules(pole_link, day, classrooms_list, classrooms_by_name, updated_at, all_rooms_response, {}, fingerprint, boundaries, table, free_rooms)
+
+# Slot of the minute of the day in the FreeRoomsIndex of a pole with the given boundaries.
+def free_rooms_slot(boundaries: array, minute) -> int:
+    k = bisect_left(boundaries, minute)
+    if k < len(boundaries) and boundaries[k] == minute:
+        return 2 * k + 1
+    return 2 * k
+
+# Builds the FreeRoomsIndex of the classrooms: the schedules of each classroom are merged in busy intervals, whose
+# start and end are boundaries, and the classroom is free, until the start of the next interval, in the slots between them.
+def build_free_rooms_index(classrooms: List[Classroom], boundaries: array) -> FreeRoomsIndex:
+    slot_of = {minute: 2 * k + 1 for k, minute in enumerate(boundaries)}
+    slots_count = 2 * len(boundaries) + 1
+    # [(free_until, classroom, first slot, last slot + 1)]
+    free_ranges: List[Tuple[int, int, int, int]] = []
+    for c, classroom in enumerate(classrooms):
+        table = classroom.table
+        busy: List[List[int]] = []
+        for p in range(classroom.first, classroom.last):
+            start = table.sorted_starts[p]
+            end = table.ends[table.sorted_indexes[p]]
+            if end < start:
+                # Never running (see get_schedule_index_at).
+                continue
+            if busy and start <= busy[-1][1]:
+                busy[-1][1] = max(busy[-1][1], end)
+            else:
+                busy.append([start, end])
+        free_from = 0
+        for start, end in busy:
+            if free_from < slot_of[start]:
+                free_ranges.append((start, c, free_from, slot_of[start]))
+            free_from = slot_of[end] + 1
+        if free_from < slots_count:
+            free_ranges.append((FREE_UNTIL_END_OF_DAY, c, free_from, slots_count))
+
+    # Filling the slots in the ranking order (the classrooms free until the same minute in the pole order), they
+    # come out sorted.
+    free_ranges.sort(key = lambda free_range: (-free_range[0], free_range[1]))
+    slots_classrooms: List[List[int]] = [[] for _ in range(slots_count)]
+    slots_free_until: List[List[int]] = [[] for _ in range(slots_count)]
+    for until, c, first_slot, last_slot in free_ranges:
+        for x in range(first_slot, last_slot):
+            slots_classrooms[x].append(c)
+            slots_free_until[x].append(until)
+
+    slot_offsets = array("I", [0])
+    free_classrooms = array("I")
+    free_until = array("H")
+    for x in range(slots_count):
+        free_classrooms.extend(slots_classrooms[x])
+        free_until.extend(slots_free_until[x])
+        slot_offsets.append(len(free_classrooms))
+    return FreeRoomsIndex(slot_offsets, free_classrooms, free_until)
+
+# Hash of the classrooms and of their schedules, as extracted from the page.
+def infos_fingerprint(infos) -> str:
+    return sha1(json.dumps(infos, sort_keys = True).encode("utf-8")).hexdigest()
+
+# The PoleSchedules model back to the "infos" list it was built from.
+def pole_schedules_to_infos(pole_schedules: PoleSchedules) -> List[Dict[str, Union[str, List[str]]]]:
+    return [{"Classroom": classroom.name, classroom.resource_id: classroom.texts()} for classroom in pole_schedules.classrooms]
+
+# Changes when the layout of serialize_pole_schedules changes, the older blobs are then rebuilt from the infos.
+MODEL_FORMAT_VERSION = 1
+
+# The PoleSchedules model as bytes: a JSON header line (classrooms, fingerprint, arrays layout), the arrays as they
+# are in memory and the texts in UTF-8. Loading it back is a copy of the arrays, no parsing and no sorting.
+# Native byte order, the blobs are meant for the processes of the same machine (see SchedulesStore).
+def serialize_pole_schedules(pole_schedules: PoleSchedules) -> bytes:
+    table = pole_schedules.table
+    header = {
+        "format": MODEL_FORMAT_VERSION,
+        "fingerprint": pole_schedules.fingerprint,
+        "classrooms": [[classroom.name, classroom.resource_id, classroom.schedules_count()] for classroom in pole_schedules.classrooms],
+        "arrays": [[name, typecode, getattr(table, name).itemsize, len(getattr(table, name))] for name, typecode in ScheduleTable.ARRAYS],
+        "byteorder": byteorder,
+    }
+    chunks = [json.dumps(header, separators = (",", ":")).encode("utf-8"), b"\n"]
+    chunks += [getattr(table, name).tobytes() for name, typecode in ScheduleTable.ARRAYS]
+    chunks.append(table.texts.encode("utf-8"))
+    return b"".join(chunks)
+
+# From serialize_pole_schedules bytes back to the PoleSchedules model, None if they have a different format.
+def deserialize_pole_schedules(pole_link, day: date, updated_at: datetime, blob: bytes) -> Optional[PoleSchedules]:
+    newline = blob.find(b"\n")
+    if newline == -1:
+        return None
+    header = json.loads(blob[:newline])
+    layout = [(name, typecode, array(typecode).itemsize) for name, typecode in ScheduleTable.ARRAYS]
+    if header.get("format") != MODEL_FORMAT_VERSION or header.get("byteorder") != byteorder or [item[:3] for item in header["arrays"]] != [list(item) for item in layout]:
+        return None
 
-            break
+    arrays = []
+    offset = newline + 1
+    for name, typecode, itemsize, length in header["arrays"]:
+        values = array(typecode)
+        values.frombytes(blob[offset:offset + itemsize * length])
+        arrays.append(values)
+        offset += itemsize * length
+    table = ScheduleTable(blob[offset:].decode("utf-8"), *arrays)
+    return build_pole_schedules_from_table(pole_link, day, updated_at, header["fingerprint"], [tuple(classroom) for classroom in header["classrooms"]], table)
+
+# Bytes of memory taken by the pole's model, by part (shared interned names counted once per pole).
+def pole_schedules_memory(pole_schedules: PoleSchedules) -> Dict[str, int]:
+    table = pole_schedules.table
+    names = {id(name): name for classroom in pole_schedules.classrooms for name in (classroom.name, classroom.resource_id)}
+    responses = [pole_schedules.all_rooms_response] + list(pole_schedules.free_now_responses.values())
+    memory = {
+        "schedules_texts": getsizeof(table.texts),
+        "schedules_arrays": getsizeof(table) + sum(getsizeof(getattr(table, name)) for name, typecode in ScheduleTable.ARRAYS),
+        "classrooms": getsizeof(pole_schedules.classrooms) + sum(getsizeof(classroom) for classroom in pole_schedules.classrooms)
+                      + getsizeof(pole_schedules.classrooms_by_name) + sum(getsizeof(name) for name in names.values()),
+        "rendered_responses": getsizeof(pole_schedules.free_now_responses) + sum(getsizeof(rendered.body) for rendered in responses),
+        "boundaries": getsizeof(pole_schedules.boundaries),
+        "free_rooms_index": getsizeof(pole_schedules.free_rooms) + sum(getsizeof(getattr(pole_schedules.free_rooms, name)) for name in FreeRoomsIndex.__slots__),
+    }
+    memory["total"] = sum(memory.values())
+    return memory
+
+###########################################     EVENTS FEED BACKEND        ###########################################
+
+FEED_TIMEOUT_SECONDS = 15
+# The feed is captured again with Selenium after this time, to pick up classrooms added or removed in the pole.
+FEED_MAX_AGE_SECONDS = int(environ.get("FEED_MAX_AGE_SECONDS", "86400"))
+
+# What was learned, for a pole, from the Selenium page load about the calendar events feed.
+class FeedContract(NamedTuple):
+    # The feed URL as requested by the page, its dates are moved to the day of the refresh.
+    url: str
+    captured_on: date
+    captured_at: datetime
+    # [(classroom_name, resource_id)] in the page order, the feed only has the events.
+    classrooms: List[Tuple[str, str]]
+
+feed_contracts: Dict[str, FeedContract] = {}
+feed_contracts_lock = Lock()
+
+# Pooled connections, shared by the refresh workers.
+feed_session = Session()
+feed_session.mount("https://", HTTPAdapter(pool_connections = 1, pool_maxsize = 16))
+feed_session.mount("http://", HTTPAdapter(pool_connections = 1, pool_maxsize = 16))
+
+ISO_DATE_REGEX = re.compile(r"\d{4}-\d{2}-\d{2}")
+
+def get_feed_contract(pole_link) -> Optional[FeedContract]:
+    with feed_contracts_lock:
+        contract = feed_contracts.get(pole_link)
+    if contract is not None and (datetime.now() - contract.captured_at).total_seconds() > FEED_MAX_AGE_SECONDS:
+        return None
+    return contract
+
+def drop_feed_contract(pole_link):
+    with feed_contracts_lock:
+        feed_contracts.pop(pole_link, None)
+
+# Moves all the dates in the URL query by the days between the capture and the given day (the feed asks for the shown day).
+def feed_url_for_day(contract: FeedContract, day: date) -> str:
+    days = (day - contract.captured_on).days
+    if days == 0:
+        return contract.url
+
+    def shift(match):
+        return (date.fromisoformat(match.group(0)) + timedelta(days = days)).isoformat()
+
+    parts = urlsplit(contract.url)
+    query = [(key, ISO_DATE_REGEX.sub(shift, value)) for key, value in parse_qsl(parts.query, keep_blank_values = True)]
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, urlencode(query), parts.fragment))
+
+# The page renders each event as <span class="fc-time">start - end</span><span class="fc-title">title</span>, the title
+# being HTML. The event is rendered the same way and read by SchedulePageParser, so its text is exactly the one
+# escrape_schedule_page gives for it (the '|' after a title without <br>, "&amp;" removed, the same inline tags).
+FEED_EVENT_HTML = (
+    '<td class="fc-time-area fc-widget-content"><table><tr data-resource-id="event"><td>'
+    '<a><span class="fc-time">{time}</span><span class="fc-title">{title}</span></a></td></tr></table></td>'
+)
+
+# Returns the text of the event as read from the page, None if its title markup is broken.
+def feed_event_text(start: datetime, end: datetime, title: str) -> Optional[str]:
+    parser = SchedulePageParser()
+    try:
+        parser.feed(FEED_EVENT_HTML.format(time = f"{start.strftime('%H:%M')} - {end.strftime('%H:%M')}", title = title))
+        parser.close()
+    except ValueError:
+        return None
+    if len(parser.schedules) != 1:
+        return None
+    return parser.schedules[0][1]
 
-        schedule = schedule_a.text
+# From the FullCalendar events JSON ([{"resourceId": ..., "start": ..., "end": ..., "title": ...}, ...]) builds
+# the same "infos" list escrape_schedule_page builds from the page.
+# Returns None if the events are not what was captured (unknown structure or classrooms), the feed contract changed.
+def feed_events_to_infos(events, classrooms: List[Tuple[str, str]], day: date) -> Optional[List[Dict[str, Union[str, List[str]]]]]:
+    if not isinstance(events, list):
+        return None
 
-        # We need to navigate the DOM to get the parent <tr> tag and the associated data-resource-id.
-        # data-resource-id is an attribute of the <tr> tag.
-        tr_parent = schedule_a.find_parent("tr")
-        tr_parent_id = tr_parent['data-resource-id']
+    schedules_by_resource: Dict[str, List[Tuple[datetime, str]]] = {resource_id: [] for name, resource_id in classrooms}
+    for event in events:
+        if not isinstance(event, dict) or not isinstance(event.get("start"), str) or not isinstance(event.get("end"), str):
+            return None
 
-        if current_row_id == "":
-            # First iteration.
-            current_row_id = tr_parent_id
-            # The process of the first row is skipped, balanced by the last iteration.
-        else:
-            if current_row_id != tr_parent_id:
-                # New row's id.
-                info = {}
-                info[current_row_id] = current_row_schedules.copy()
-                list_of_schedules.append(info)
+        resource_ids = event.get("resourceIds")
+        if resource_ids is None:
+            resource_ids = [event.get("resourceId")]
+        if not isinstance(resource_ids, list):
+            return None
 
-                current_row_schedules.clear()
+        try:
+            start = datetime.fromisoformat(event["start"])
+            end = datetime.fromisoformat(event["end"])
+        except ValueError:
+            return None
+        if start.date() != day:
+            continue
+
+        text = feed_event_text(start, end, str(event.get("title") or ""))
+        if text is None:
+            return None
+
+        for resource_id in resource_ids:
+            resource_id = str(resource_id)
+            if resource_id not in schedules_by_resource:
+                return None
+            schedules_by_resource[resource_id].append((start, text))
 
-                current_row_id = tr_parent_id
+    infos: List[Dict[str, Union[str, List[str]]]] = []
+    for name, resource_id in classrooms:
+        schedules = sorted(schedules_by_resource[resource_id], key = lambda schedule: schedule[0])
+        infos.append({"Classroom": name, resource_id: [text for start, text in schedules]})
+    return infos
 
-        current_row_schedules.append(schedule)
+# Same time rows per classroom, the only part the free classrooms computations rely on.
+def same_schedules_times(infos_a, infos_b) -> bool:
+    def times(infos):
+        return [
+            (info["Classroom"], sorted(schedule.split("|")[0].replace(" ", "") for schedule in info[list(info.keys())[1]]))
+            for info in infos
+        ]
+    return times(infos_a) == times(infos_b)
+
+# Looks in the network logs of the page just loaded by the driver for the JSON response holding the calendar events.
+# The feed is adopted only if it describes exactly the same schedules of the rendered page.
+def capture_feed_contract(driver, pole_link, page_source):
+    try:
+        page_infos = escrape_schedule_page(page_source)
+        if page_infos is None:
+            return
+        classrooms = [(info["Classroom"], list(info.keys())[1]) for info in page_infos]
+
+        for entry in driver.get_log("performance"):
+            message = json.loads(entry["message"])["message"]
+            if message.get("method") != "Network.responseReceived":
+                continue
+            params = message["params"]
+            if params.get("type") not in ("XHR", "Fetch") or "json" not in params["response"].get("mimeType", ""):
+                continue
 
-    # Joining all the infos.
-    for i in range(len(list(rows_second))):
-        row = rows_second[i]
+            try:
+                body = driver.execute_cdp_cmd("Network.getResponseBody", {"requestId": params["requestId"]})
+                events = json.loads(body["body"])
+            except Exception:
+                continue
+
+            infos = feed_events_to_infos(events, classrooms, date.today())
+            if infos is not None and same_schedules_times(infos, page_infos):
+                with feed_contracts_lock:
+                    feed_contracts[pole_link] = FeedContract(params["response"]["url"], date.today(), datetime.now(), classrooms)
+                print(f"Events feed captured for {pole_link}.")
+                return
+    except Exception as e:
+        print(f"Events feed capture error for {pole_link}: {e}")
 
-        info = {}
-        info["Classroom"] = classrooms[i]
-        # Initializing the list of schedules.
-        info[rows_ids[i]] = []
-        for schedule in list_of_schedules:
-            if rows_ids[i] in schedule:
-                info[rows_ids[i]] = schedule[rows_ids[i]]
-                break
+# Downloads the pole's events feed, returns the "infos" list or None if there is no feed or it changed
+# (the caller then falls back to Selenium, that captures it again).
+def feed_get_schedule_infos(pole_link, day: Optional[date] = None) -> Optional[List[Dict[str, Union[str, List[str]]]]]:
+    contract = get_feed_contract(pole_link)
+    if contract is None:
+        return None
+    if day is None:
+        day = date.today()
 
-        infos.append(info)
+    try:
+        response = feed_session.get(feed_url_for_day(contract, day), timeout = FEED_TIMEOUT_SECONDS)
+    except Exception as e:
+        print(f"Events feed error for {pole_link}: {e}")
+        return None
+    return feed_response_to_infos(pole_link, contract, day, response.status_code, response.json)
 
-    # Replacing unparsed a datas with parsed one.
-    unparsed_tmp = [e.replace("|", "") for e in all_parsed_a]
-    for classroom in infos:
-        rsid = list(classroom.keys())[1]
-        schedules = classroom[rsid]
-        for counter in range(len(schedules)):
-            cu = 0
-            for u in unparsed_tmp:
-                if schedules[counter].startswith(u[0:20]):
-                    schedules[counter] = all_parsed_a[cu].replace("&amp;", "")
-                    break
-                cu += 1
+# Turns the events feed response (json_body decodes it) in the "infos" list, None on errors.
+def feed_response_to_infos(pole_link, contract: FeedContract, day: date, status_code, json_body: Callable[[], Any]) -> Optional[List[Dict[str, Union[str, List[str]]]]]:
+    if status_code != 200:
+        print(f"Events feed error for {pole_link}: wrong status code {status_code}.")
+        return None
+    try:
+        infos = feed_events_to_infos(json_body(), contract.classrooms, day)
+    except Exception as e:
+        print(f"Events feed error for {pole_link}: {e}")
+        return None
 
+    if infos is None:
+        print(f"Events feed of {pole_link} changed, back to Selenium.")
+        drop_feed_contract(pole_link)
     return infos
 
-# INFOS ARG STRCTURE (TO BE GOT FROM escrape_schedule_page):
-# [
-#   {"Classroom": "classroom_name", "RESOURCE_ID_ROW_DYNAMIC": ["schedule1", "schedule2", ...]},
-#   ...
-# ]
-# Where scheduleN is all the plain text in the <a> tag as str with each <br> row delimited by an '|'.
-# Returns:
-# [
-#   {"classroom_name": "next_schedule_start_hour"},
-#   ...
-# ]
-def get_free_classrooms_now(infos) -> List[Dict[str, str]]:
+###########################################     RECORD AND REPLAY        ###########################################
 
-    # Now.
-    time = datetime.now()
+# With SCRAPE_RECORD_DIR the poles page and every schedule page scraped with Selenium are also saved in that directory,
+# a recording that the "replay" backend (SCRAPE_REPLAY_DIR) and replay_server.py serve back without network and Chrome.
+# The events feed responses are not recorded, record with the "selenium" backend.
+# A recording:
+# recording.json                   {"recorded_on": "YYYY-MM-DD", "poles_data_url": "..."}
+# poles.html                       the poles page
+# pages/<pole key>_<days>.html     the schedule page of the pole (see recording_pole_key), days after recorded_on
+# Replayed on another day, recorded_on is today: today gets the pages of recorded_on, tomorrow the ones of the day after.
+SCRAPE_RECORD_DIR = environ.get("SCRAPE_RECORD_DIR") or None
+SCRAPE_REPLAY_DIR = environ.get("SCRAPE_REPLAY_DIR") or None
+HTTP_BACKEND_TIMEOUT_SECONDS = 15
 
-    year = time.year
-    month = time.month
-    day = time.day
-    minute = time.minute
-    hour = time.hour
+recording_lock = Lock()
 
-    frees = []
+# File name part of the pole's pages, the same for the pole link in recording_page_path and in replay_server.py.
+def recording_pole_key(pole_link) -> str:
+    return sha1(pole_link.encode("utf-8")).hexdigest()[:16]
 
-    for classroom in infos:
-        schedules = classroom[list(classroom.keys())[1]]
+def recording_page_path(directory, pole_key, days) -> str:
+    return path.join(directory, "pages", f"{pole_key}_{days}.html")
 
-        # Detecting free classrooms.
-        free = True
-        for schedule in schedules:
-            timestartend = schedule.split("|")[0]
+# Returns the day the recording in the directory was started, None if there is no recording.
+def recording_day(directory) -> Optional[date]:
+    try:
+        with open(path.join(directory, "recording.json"), encoding = "utf-8") as f:
+            return date.fromisoformat(json.load(f)["recorded_on"])
+    except (OSError, ValueError, KeyError):
+        return None
+
+# Returns the day the recording in SCRAPE_RECORD_DIR was started, starting it if needed.
+def start_recording() -> date:
+    with recording_lock:
+        day = recording_day(SCRAPE_RECORD_DIR)
+        if day is None:
+            day = date.today()
+            makedirs(path.join(SCRAPE_RECORD_DIR, "pages"), exist_ok = True)
+            with open(path.join(SCRAPE_RECORD_DIR, "recording.json"), "w", encoding = "utf-8") as f:
+                json.dump({"recorded_on": day.isoformat(), "poles_data_url": POLES_DATA_URL}, f)
+        return day
+
+# Saves the file atomically, the replay_server.py reading the same directory never sees it half written.
+def write_recording_file(file_path, content: bytes):
+    temporary_path = file_path + ".tmp"
+    with open(temporary_path, "wb") as f:
+        f.write(content)
+    replace(temporary_path, file_path)
+
+def record_poles_page(content: bytes):
+    try:
+        start_recording()
+        write_recording_file(path.join(SCRAPE_RECORD_DIR, "poles.html"), content)
+    except Exception as e:
+        print(f"Recording error for the poles page: {e}")
 
-            timestart = datetime.strptime(timestartend.split("-")[0].strip(), "%H:%M")
-            timeend = datetime.strptime(timestartend.split("-")[1].strip(), "%H:%M")
+def record_schedule_page(pole_link, day: date, page_source):
+    try:
+        days = (day - start_recording()).days
+        write_recording_file(recording_page_path(SCRAPE_RECORD_DIR, recording_pole_key(pole_link), days), page_source.encode("utf-8"))
+    except Exception as e:
+        print(f"Recording error for {pole_link}: {e}")
 
-            timestart = datetime(year=year, month=month, day=day, hour=timestart.hour, minute=timestart.minute)
-            timeend = datetime(year=year, month=month, day=day, hour=timeend.hour, minute=timeend.minute)
+# The recorded poles page (the "replay" backend), None if missing.
+def replay_poles_page() -> Optional[bytes]:
+    try:
+        with open(path.join(SCRAPE_REPLAY_DIR, "poles.html"), "rb") as f:
+            return f.read()
+    except OSError as e:
+        print(f"Replay error for the poles page: {e}")
+        return None
 
-            if timestart <= time <= timeend:
-                free = False
-                break
+# The recorded schedule page of the pole's day (the "replay" backend), None if missing.
+def replay_schedule_page(pole_link, day: date) -> Optional[str]:
+    if recording_day(SCRAPE_REPLAY_DIR) is None:
+        print(f"Replay error: no recording in {SCRAPE_REPLAY_DIR}.")
+        return None
+    days = (day - date.today()).days
+    try:
+        with open(recording_page_path(SCRAPE_REPLAY_DIR, recording_pole_key(pole_link), days), encoding = "utf-8") as f:
+            return f.read()
+    except OSError:
+        print(f"Replay error for {pole_link}: no page recorded for {days} days after the recording day.")
+        return None
 
-        # Detecting next schedule start time.
-        if free:
-            timesstarts = []
-            for schedule in schedules:
-                timestartend = schedule.split("|")[0]
+# Downloads the schedule page of the pole's day as is (the "http" backend), the site has to serve it already rendered
+# and to take the day as the date query arg, as replay_server.py does. None on errors.
+def http_get_schedule_page(pole_link, day: date) -> Optional[str]:
+    try:
+        response = feed_session.get(pole_link, params = {"date": day.isoformat()}, timeout = HTTP_BACKEND_TIMEOUT_SECONDS)
+    except Exception as e:
+        print(f"Web request error for {pole_link}: {e}")
+        return None
+    if response.status_code != 200:
+        print(f"Web request error for {pole_link}: wrong status code {response.status_code}.")
+        return None
+    return response.text
 
-                timestart = datetime.strptime(timestartend.split("-")[0].strip(), "%H:%M")
-                timestart = datetime(year=year, month=month, day=day, hour=timestart.hour, minute=timestart.minute)
+###########################################     QUERIES        ###########################################
 
-                timesstarts.append(timestart)
+# Returns the index in the pole's ScheduleTable of the schedule of the classroom running at the given minute of the
+# day, None if the classroom is free. If more schedules overlap, the one started last.
+def get_schedule_index_at(classroom: Classroom, minute) -> Optional[int]:
+    table = classroom.table
+    # Schedules started by the minute.
+    p = bisect_right(table.sorted_starts, minute, classroom.first, classroom.last)
+    if p == classroom.first or table.ends_max[p - 1] < minute:
+        return None
+    for q in range(p - 1, classroom.first - 1, -1):
+        i = table.sorted_indexes[q]
+        if table.ends[i] >= minute:
+            return i
+    return None
+
+# Same as get_schedule_index_at, returns the Schedule.
+def get_schedule_at(classroom: Classroom, minute) -> Optional[Schedule]:
+    i = get_schedule_index_at(classroom, minute)
+    return None if i is None else classroom.table.schedule(i)
+
+# Returns the start (minutes from midnight) of the first schedule of the classroom starting at or after the given
+# minute of the day, None if there are no more schedules.
+def get_next_start(classroom: Classroom, minute) -> Optional[int]:
+    p = bisect_left(classroom.table.sorted_starts, minute, classroom.first, classroom.last)
+    if p == classroom.last:
+        return None
+    return classroom.table.sorted_starts[p]
 
-            sorted_times = sorted(timesstarts)
+# CLASSROOMS ARG IS THE classrooms LIST OF A PoleSchedules (TO BE GOT FROM get_pole_schedules).
+# Returns the classrooms free at the given minute of the day and for at least min_free_minutes after it:
+# [
+#   {"classroom_name": "next_schedule_start_hour"},
+#   ...
+# ]
+def get_free_classrooms_at(classrooms: List[Classroom], minute, min_free_minutes = 0) -> List[Dict[str, str]]:
+    frees = []
+    with timed(stage_duration, "query"):
+        for classroom in classrooms:
+            if get_schedule_index_at(classroom, minute) is None:
+                nextstart = get_next_start(classroom, minute)
+                if nextstart is not None and nextstart - minute < min_free_minutes:
+                    continue
+                frees.append({classroom.name: None if nextstart is None else format_minutes(nextstart)})
+    return frees
 
-            nextstart = ""
-            for timec in sorted_times:
-                if time <= timec:
-                    nextstart = timec
-                    break
+# Returns the free slots of the classroom from the given minute of the day to the end of the day:
+# [
+#   {"from": "HH:MM", "to": "HH:MM"},
+#   ...
+# ]
+# Where "to" of the last slot is None if the classroom stays free until the end of the day.
+def get_free_slots(classroom: Classroom, minute) -> List[Dict[str, Optional[str]]]:
+    slots = []
+    free_from = minute
+    with timed(stage_duration, "query"):
+        table = classroom.table
+        for p in range(classroom.first, classroom.last):
+            start = table.sorted_starts[p]
+            end = table.ends[table.sorted_indexes[p]]
+            if end < free_from:
+                continue
+            if start > free_from:
+                slots.append({"from": format_minutes(free_from), "to": format_minutes(start)})
+            free_from = max(free_from, end)
+        if free_from < 24 * 60:
+            slots.append({"from": format_minutes(free_from), "to": None})
+    return slots
+
+# Turns the next schedule start of each free classroom (see get_free_classrooms_at) in the text shown to the users.
+def describe_free_classrooms(free_classrooms: List[Dict[str, str]]) -> List[Dict[str, str]]:
+    for classroom in free_classrooms:
+        for key, value in classroom.items():
+            classroom[key] = "Free until: " + str(classroom[key])
+            if "None" in classroom[key]:
+                classroom[key] = classroom[key].replace("None", "end of day")
+    return free_classrooms
 
-            if nextstart == "":
-                nextstart = None
-            else:
-                nextstart = nextstart.strftime("%H:%M")
+# Returns the minute of the day of the "time" request arg ("HH:MM"), now if it is missing, None if it is invalid.
+def get_time_arg(args) -> Optional[float]:
+    time = args.get("time")
+    if not time:
+        return minutes_of_day(datetime.now())
+    try:
+        return parse_minutes(time.strip())
+    except ValueError:
+        return None
 
-            frees.append({classroom["Classroom"]: nextstart})
+# Returns the request arg as a non negative integer, default if it is missing, None if it is invalid.
+def get_count_arg(args, name, default: int) -> Optional[int]:
+    try:
+        value = int(args.get(name, str(default)))
+    except ValueError:
+        return None
+    return value if value >= 0 else None
+
+# Returns the day of the "date" request arg ("YYYY-MM-DD"), today if it is missing, None if it is invalid or not
+# one of the scraped days (see SCRAPE_DAYS).
+def get_date_arg(args) -> Optional[date]:
+    day = args.get("date")
+    if not day:
+        return date.today()
+    try:
+        day = date.fromisoformat(day.strip())
+    except ValueError:
+        return None
+    if day not in scraped_days():
+        return None
+    return day
+
+# Same as get_free_classrooms_at, now.
+def get_free_classrooms_now(classrooms: List[Classroom]) -> List[Dict[str, str]]:
+    return get_free_classrooms_at(classrooms, minutes_of_day(datetime.now()))
+
+# Returns the rendered free classrooms response of the pole for the current minute, computed once per minute.
+def get_free_classrooms_now_response(pole_schedules: PoleSchedules) -> RenderedResponse:
+    now = datetime.now()
+    minute = int(minutes_of_day(now))
+    rendered = pole_schedules.free_now_responses.get(minute)
+    if rendered is None:
+        free_classrooms = describe_free_classrooms(get_free_classrooms_at(pole_schedules.classrooms, minute))
+        # Changes with the schedules and with the minute.
+        rendered = render_json({"free_classrooms": free_classrooms}, max(pole_schedules.updated_at, now.replace(second = 0, microsecond = 0)))
+        # The previous minutes are not requested anymore.
+        pole_schedules.free_now_responses.clear()
+        pole_schedules.free_now_responses[minute] = rendered
+    return rendered
+
+# A free classroom found by search_free_classrooms.
+class FreeClassroom(NamedTuple):
+    pole_link: str
+    classroom: str
+    # Minutes from midnight, FREE_UNTIL_END_OF_DAY if free until the end of the day.
+    free_until: int
+
+# Returns the classrooms of the pole free at the given minute of the day and for at least min_free_minutes after
+# it, the longest free first. From the pole's FreeRoomsIndex, the classrooms free for less are not looked at.
+def iter_free_classrooms_at(pole_schedules: PoleSchedules, minute, min_free_minutes = 0) -> Iterator[FreeClassroom]:
+    index = pole_schedules.free_rooms
+    slot = free_rooms_slot(pole_schedules.boundaries, minute)
+    for p in range(index.slot_offsets[slot], index.slot_offsets[slot + 1]):
+        free_until = index.free_until[p]
+        if free_until != FREE_UNTIL_END_OF_DAY and free_until - minute < min_free_minutes:
+            # The next ones are free for even less.
+            break
+        yield FreeClassroom(pole_schedules.pole_link, pole_schedules.classrooms[index.classrooms[p]].name, free_until)
+
+# Returns the classrooms of all the given poles free at the given minute of the day and for at least
+# min_free_minutes after it, the longest free first (same free_until in the poles order), at most limit.
+# The ranked classrooms of each pole are merged with a heap, so only about limit of them are looked at.
+def search_free_classrooms(poles_schedules: List[PoleSchedules], minute, min_free_minutes = 0, limit: Optional[int] = None) -> List[FreeClassroom]:
+    with timed(stage_duration, "query"):
+        ranked = heapq.merge(*(iter_free_classrooms_at(pole_schedules, minute, min_free_minutes) for pole_schedules in poles_schedules), key = lambda free: -free.free_until)
+        return list(islice(ranked, limit))
+
+###########################################     METRICS        ###########################################
+
+# Upper bounds, in seconds, of the duration histograms' buckets: from the cached answers (fractions of a millisecond)
+# to the Selenium scrapes (seconds).
+METRICS_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+def format_labels(names, values) -> str:
+    if not names:
+        return ""
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+# Counter with a series per labels' values, in the Prometheus text format.
+class Counter:
+    def __init__(self, name, help, label_names: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.label_names = label_names
+        self.lock = Lock()
+        self.series: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels, amount = 1):
+        with self.lock:
+            self.series[labels] = self.series.get(labels, 0) + amount
+
+    def exposition(self) -> List[str]:
+        with self.lock:
+            series = sorted(self.series.items())
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for labels, value in series:
+            lines.append(f"{self.name}{format_labels(self.label_names, labels)} {value}")
+        return lines
+
+# Durations histogram with a series per labels' values, in the Prometheus text format.
+class Histogram:
+    def __init__(self, name, help, label_names: Tuple[str, ...] = (), buckets = METRICS_BUCKETS):
+        self.name = name
+        self.help = help
+        self.label_names = label_names
+        self.buckets = buckets
+        self.lock = Lock()
+        # labels -> [count of each bucket (not cumulative) and of +Inf, sum, count].
+        self.series: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, seconds, *labels):
+        i = bisect_left(self.buckets, seconds)
+        with self.lock:
+            series = self.series.get(labels)
+            if series is None:
+                series = [0] * (len(self.buckets) + 3)
+                self.series[labels] = series
+            series[i] += 1
+            series[-2] += seconds
+            series[-1] += 1
+
+    def exposition(self) -> List[str]:
+        with self.lock:
+            series = sorted((labels, list(values)) for labels, values in self.series.items())
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, values in series:
+            cumulative = 0
+            for bound, count in zip(list(self.buckets) + ["+Inf"], values):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{format_labels(self.label_names + ('le',), labels + (bound,))} {cumulative}")
+            lines.append(f"{self.name}_sum{format_labels(self.label_names, labels)} {values[-2]}")
+            lines.append(f"{self.name}_count{format_labels(self.label_names, labels)} {values[-1]}")
+        return lines
+
+# Observes in the histogram how long the with block takes.
+@contextmanager
+def timed(histogram: Histogram, *labels):
+    # The stages are also added to the breakdown of the request being served by the thread, if any.
+    profile = getattr(request_profiles, "current", None) if histogram is stage_duration else None
+    if profile is not None:
+        profile.enter_stage()
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = perf_counter() - start
+        histogram.observe(elapsed, *labels)
+        if profile is not None:
+            profile.leave_stage(labels[0], elapsed)
+
+# The metrics are per process, with more gunicorn workers each one has its own (and only the refresher scrapes).
+stage_duration = Histogram(
+    "unipi_stage_duration_seconds",
+    "Duration of the work stages: fetch_poles, poles_wait, scrape_selenium, scrape_feed, scrape_replay, scrape_http, scrape_wait, parse, build_model, query and serialize.",
+    ("stage",),
+)
+request_duration = Histogram("unipi_request_duration_seconds", "Duration of the requests, until the response is ready.", ("route",))
+requests_total = Counter("unipi_requests_total", "Requests answered.", ("route", "status"))
+schedules_cache_lookups_total = Counter("unipi_schedules_cache_lookups_total", "Lookups of the parsed schedules cache, hit or miss.", ("result",))
+scrapes_total = Counter("unipi_scrapes_total", "Scrapes of the schedule pages.", ("backend", "result"))
+
+# Driver pool counters, as returned by DriverPool.stats: name -> (metric type, help).
+DRIVER_POOL_METRICS = {
+    "launches": ("counter", "Chrome drivers launched."),
+    "launch_failures": ("counter", "Chrome drivers failed to launch."),
+    "recycles": ("counter", "Chrome drivers replaced after too many pages or too long idle."),
+    "crashes": ("counter", "Chrome drivers dropped because broken."),
+    "pages": ("counter", "Pages loaded by the Chrome drivers."),
+    "alive": ("gauge", "Chrome drivers running."),
+    "in_use": ("gauge", "Chrome drivers scraping."),
+}
+
+# Returns all the metrics in the Prometheus text format.
+def metrics_exposition() -> str:
+    lines: List[str] = []
+    for metric in (stage_duration, request_duration, requests_total, schedules_cache_lookups_total, scrapes_total):
+        lines += metric.exposition()
+
+    stats = driver_pool.stats()
+    for name, (kind, help) in DRIVER_POOL_METRICS.items():
+        metric = f"unipi_driver_{name}" + ("_total" if kind == "counter" else "")
+        lines += [f"# HELP {metric} {help}", f"# TYPE {metric} {kind}", f"{metric} {stats[name]}"]
+
+    # Age and size of the cached schedules of each pole and day.
+    now = datetime.now()
+    with cache_lock:
+        cached = sorted(schedules_model_cache.items())
+        pages = {key: len(page) for key, page in src_schedules_page_cache.items()}
+    gauges = {
+        "unipi_pole_cache_age_seconds": "Seconds since the cached schedules changed.",
+        "unipi_pole_cache_classrooms": "Classrooms in the cached schedules.",
+        "unipi_pole_cache_schedules": "Schedules in the cached schedules.",
+        "unipi_pole_cache_page_bytes": "Characters of the cached raw page, 0 if not cached (events feed, CACHE_SCHEDULE_PAGES off).",
+        "unipi_pole_cache_model_bytes": "Bytes of memory taken by the parsed schedules model.",
+    }
+    values = {name: [] for name in gauges}
+    for (pole_link, day), pole_schedules in cached:
+        labels = format_labels(("pole", "day"), (pole_link, day.isoformat()))
+        values["unipi_pole_cache_age_seconds"].append(f"{labels} {round((now - pole_schedules.updated_at).total_seconds(), 3)}")
+        values["unipi_pole_cache_classrooms"].append(f"{labels} {len(pole_schedules.classrooms)}")
+        values["unipi_pole_cache_schedules"].append(f"{labels} {len(pole_schedules.table)}")
+        values["unipi_pole_cache_page_bytes"].append(f"{labels} {pages.get((pole_link, day), 0)}")
+        values["unipi_pole_cache_model_bytes"].append(f"{labels} {pole_schedules_memory(pole_schedules)['total']}")
+    for name, help in gauges.items():
+        lines += [f"# HELP {name} {help}", f"# TYPE {name} gauge"] + [name + value for value in values[name]]
+
+    return "\n".join(lines) + "\n"
+
+# Flask's JSON serialization (jsonify), timed as the serialize stage.
+class TimedJSONProvider(DefaultJSONProvider):
+    def dumps(self, obj, **kwargs):
+        with timed(stage_duration, "serialize"):
+            return super().dumps(obj, **kwargs)
+
+###########################################     PROFILING        ###########################################
+
+# Every request gets the breakdown of its time by stage (the stages of stage_duration, each without the stages nested
+# in it, and "other" for the rest: routing, lookups, waits outside the stages), a few dict updates per stage.
+# Some requests are also profiled with cProfile: the ones with the PROFILE_HEADER header set to PROFILE_TOKEN (disabled
+# without a token) and a PROFILE_SAMPLE_RATE fraction of all of them. cProfile slows the request down and only one
+# request at a time is profiled with it, the others meanwhile get only the stages.
+# The requests slower than SLOW_REQUEST_THRESHOLD_SECONDS (0 disables) and the ones profiled by the header are
+# recorded: a JSON line in the rotating SLOW_REQUESTS_LOG_PATH (empty disables it) and in memory, for /api/slow_requests.
+# The profiled requests by the header also get the Server-Timing response header.
+# Per process, as the metrics. With asgi.py the loads done before calling the view (prepare_request) are not included.
+PROFILE_HEADER = environ.get("PROFILE_HEADER", "X-Profile")
+PROFILE_TOKEN = environ.get("PROFILE_TOKEN", "")
+PROFILE_SAMPLE_RATE = float(environ.get("PROFILE_SAMPLE_RATE", "0"))
+# Functions in a cProfile record, by cumulative time.
+PROFILE_TOP_FUNCTIONS = 25
+SLOW_REQUEST_THRESHOLD_SECONDS = float(environ.get("SLOW_REQUEST_THRESHOLD_SECONDS", "1"))
+# With more gunicorn workers appending to the same file, a line can be lost when the file is rotated.
+SLOW_REQUESTS_LOG_PATH = environ.get("SLOW_REQUESTS_LOG_PATH", path.join(path.dirname(path.abspath(__file__)), "slow_requests.log")) or None
+SLOW_REQUESTS_LOG_MAX_BYTES = int(environ.get("SLOW_REQUESTS_LOG_MAX_BYTES", str(5 * 1024 * 1024)))
+SLOW_REQUESTS_LOG_BACKUPS = int(environ.get("SLOW_REQUESTS_LOG_BACKUPS", "3"))
+# Records kept in memory, the most recent ones.
+SLOW_REQUESTS_KEPT = 200
+
+# The RequestProfile of the request served by the thread, in current.
+request_profiles = local()
+# Held by the request profiled with cProfile.
+cprofile_lock = Lock()
+
+slow_requests: deque = deque(maxlen = SLOW_REQUESTS_KEPT)
+slow_requests_lock = Lock()
+slow_requests_logger: Optional[logging.Logger] = None
+
+class RequestProfile:
+    def __init__(self, trigger: Optional[str]):
+        self.started_at = perf_counter()
+        # "header", "sample" or None.
+        self.trigger = trigger
+        # Stage -> [seconds, count], seconds without the nested stages.
+        self.stages: Dict[str, List[Union[float, int]]] = {}
+        # For each stage running, the seconds of the stages nested in it.
+        self.nested: List[float] = []
+        self.profiler: Optional[cProfile.Profile] = None
+        if trigger is not None and cprofile_lock.acquire(blocking = False):
+            try:
+                self.profiler = cProfile.Profile()
+                self.profiler.enable()
+            except ValueError:
+                # Another profiler is active (the process runs under a profiler).
+                self.profiler = None
+                cprofile_lock.release()
+
+    def enter_stage(self):
+        self.nested.append(0.0)
+
+    def leave_stage(self, stage, elapsed):
+        nested = self.nested.pop()
+        totals = self.stages.setdefault(stage, [0.0, 0])
+        totals[0] += elapsed - nested
+        totals[1] += 1
+        if self.nested:
+            self.nested[-1] += elapsed
+
+    # Stops cProfile, returns its top functions (empty if not profiled with it).
+    def stop_profiler(self) -> List[Dict[str, Union[str, int, float]]]:
+        if self.profiler is None:
+            return []
+        self.profiler.disable()
+        cprofile_lock.release()
+        stats = pstats.Stats(self.profiler).stats
+        self.profiler = None
+        top = sorted(stats.items(), key = lambda item: item[1][3], reverse = True)[:PROFILE_TOP_FUNCTIONS]
+        return [
+            {"function": "{}:{}({})".format(*pstats.func_strip_path(function)), "calls": calls, "own_seconds": round(own, 6), "cumulative_seconds": round(cumulative, 6)}
+            for function, (primitive_calls, calls, own, cumulative, callers) in top
+        ]
+
+# Returns the trigger of cProfile for the request ("header", "sample"), None if it is not profiled with it.
+def request_profile_trigger(headers) -> Optional[str]:
+    if PROFILE_TOKEN and headers.get(PROFILE_HEADER) == PROFILE_TOKEN:
+        return "header"
+    if PROFILE_SAMPLE_RATE > 0 and random() < PROFILE_SAMPLE_RATE:
+        return "sample"
+    return None
+
+# The Server-Timing header value, in milliseconds.
+def server_timing(record) -> str:
+    timings = [f"{stage};dur={values['seconds'] * 1000:.3f}" for stage, values in record["stages"].items()]
+    timings.append(f"other;dur={record['other_seconds'] * 1000:.3f}")
+    timings.append(f"total;dur={record['duration_seconds'] * 1000:.3f}")
+    return ", ".join(timings)
+
+def get_slow_requests_logger() -> logging.Logger:
+    global slow_requests_logger
+    with slow_requests_lock:
+        if slow_requests_logger is None:
+            logger = logging.getLogger("unipi.slow_requests")
+            logger.propagate = False
+            logger.setLevel(logging.INFO)
+            handler = RotatingFileHandler(SLOW_REQUESTS_LOG_PATH, maxBytes = SLOW_REQUESTS_LOG_MAX_BYTES, backupCount = SLOW_REQUESTS_LOG_BACKUPS, encoding = "utf-8")
+            logger.addHandler(handler)
+            slow_requests_logger = logger
+    return slow_requests_logger
+
+def record_slow_request(record):
+    with slow_requests_lock:
+        slow_requests.append(record)
+    if SLOW_REQUESTS_LOG_PATH is None:
+        return
+    try:
+        get_slow_requests_logger().info(json.dumps(record, separators = (",", ":")))
+    except Exception as e:
+        print(f"Slow requests log error: {e}")
 
-    return frees
+# Returns the worst recorded requests, the slowest first.
+def get_worst_requests(limit) -> List[Dict[str, Any]]:
+    with slow_requests_lock:
+        records = list(slow_requests)
+    return sorted(records, key = lambda record: record["duration_seconds"], reverse = True)[:limit]
 
 ###########################################     APIs        ###########################################
 
 # Flask setup.
 app = Flask(__name__)
+app.json = TimedJSONProvider(app)
 CORS(app)
 
+# Client cache lifetime of the responses that change only when the cache is refreshed, then they are revalidated
+# with the ETag (If-None-Match) and answered with a 304 if unchanged.
+RESPONSES_MAX_AGE_SECONDS = 60
+
+# Serves a rendered response, with 304 Not Modified if the client already has it.
+def send_rendered(rendered: RenderedResponse, max_age = RESPONSES_MAX_AGE_SECONDS) -> Response:
+    response = Response(rendered.body, mimetype = "application/json")
+    response.set_etag(rendered.etag)
+    response.last_modified = rendered.last_modified
+    response.cache_control.public = True
+    response.cache_control.max_age = max_age
+    return response.make_conditional(request)
+
+@app.before_request
+def start_request_timer():
+    request.environ["unipi.started_at"] = perf_counter()
+
+@app.after_request
+def count_request(response):
+    route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+    started_at = request.environ.get("unipi.started_at")
+    if started_at is not None:
+        request_duration.observe(perf_counter() - started_at, route)
+    requests_total.inc(route, str(response.status_code))
+    return response
+
+@app.before_request
+def start_request_profile():
+    request_profiles.current = RequestProfile(request_profile_trigger(request.headers))
+
+# Records the request if it was slow or profiled by the header (see PROFILING).
+@app.after_request
+def finish_request_profile(response):
+    profile = getattr(request_profiles, "current", None)
+    if profile is None:
+        return response
+    request_profiles.current = None
+    duration = perf_counter() - profile.started_at
+    functions = profile.stop_profiler()
+    slow = SLOW_REQUEST_THRESHOLD_SECONDS > 0 and duration >= SLOW_REQUEST_THRESHOLD_SECONDS
+    if not slow and profile.trigger != "header":
+        return response
+
+    stages = {stage: {"seconds": round(seconds, 6), "count": count} for stage, (seconds, count) in profile.stages.items()}
+    record = {
+        "at": datetime.now().isoformat(timespec = "milliseconds"),
+        "method": request.method,
+        "path": request.path,
+        "query": request.query_string.decode("latin-1"),
+        "status": response.status_code,
+        "duration_seconds": round(duration, 6),
+        "stages": stages,
+        "other_seconds": round(max(0.0, duration - sum(seconds for seconds, count in profile.stages.values())), 6),
+        "slow": slow,
+        "profiled_by": profile.trigger,
+        "profile": functions,
+    }
+    record_slow_request(record)
+    if profile.trigger == "header":
+        response.headers["Server-Timing"] = server_timing(record)
+    return response
+
+# On errors the after_request functions are not called, stopping cProfile anyway.
+@app.teardown_request
+def drop_request_profile(exception = None):
+    profile = getattr(request_profiles, "current", None)
+    if profile is not None:
+        request_profiles.current = None
+        profile.stop_profiler()
+
+# Prometheus metrics: stages and requests durations, requests and scrapes counters, drivers pool and per pole cache.
+@app.route('/metrics', methods = ['GET'])
+def get_metrics():
+    return Response(metrics_exposition(), mimetype = "text/plain; version=0.0.4")
+
 # Used to list all the poles in the client.
 @app.route('/api/poles_data', methods = ['GET'])
 # Returns {"poles_data": [{"pole_name": "pole_link"}]}.
 def get_poles_data():
 
-    poles = fetch_poles_data()
-    if poles is None:
+    directory = get_poles_directory()
+    if directory is None:
         return jsonify({"message": "Error in fetching poles data."})
     
-    return jsonify({"poles_data": poles})
+    return send_rendered(directory.response)
+
+# Returns the Selenium drivers pool counters.
+# {"driver_pool": {"max_size": n, "alive": n, "idle": n, "in_use": n, "launches": n, ...}}
+@app.route('/api/driver_pool_stats', methods = ['GET'])
+def driver_pool_stats():
+    return jsonify({"driver_pool": driver_pool.stats()})
+
+# Returns how long the scraper waited each pole's page to be rendered, in seconds.
+# {"scrape_wait_times": {"pole_link": {"last": seconds, "max": seconds, "timeouts": n}}}
+@app.route('/api/scrape_wait_times', methods = ['GET'])
+def get_scrape_wait_times():
+    with scrape_wait_times_lock:
+        times = {pole_link: dict(values) for pole_link, values in scrape_wait_times.items()}
+    return jsonify({"scrape_wait_times": times})
+
+# Returns the summary of the last cache refresh and when each pole will be refreshed again.
+# {
+#   "refresh_summary": {"started_at": "...", "duration_seconds": seconds, "succeeded": ["pole_link", ...], "unchanged": ["pole_link", ...], "failed": {"pole_link": "error"}},
+#   "next_refresh_at": {"pole_link": "..."}
+# }
+@app.route('/api/refresh_summary', methods = ['GET'])
+def get_refresh_summary():
+    summary = last_refresh_summary
+    if summary is None:
+        return jsonify({"message": "No cache refresh completed yet."})
+    return jsonify({"refresh_summary": {
+        "started_at": summary.started_at.isoformat(timespec = "seconds"),
+        "duration_seconds": summary.duration_seconds,
+        "succeeded": summary.succeeded,
+        "unchanged": summary.unchanged,
+        "failed": summary.failed,
+    }, "next_refresh_at": {pole_link: time.isoformat(timespec = "seconds") for pole_link, time in list(next_refresh_at.items())}})
+
+# Returns the slowest of the last recorded requests (see PROFILING), at most limit (default 20).
+# {
+#   "threshold_seconds": seconds,
+#   "slow_requests": [
+#     {"at": "...", "method": "GET", "path": "/api/...", "query": "...", "status": 200, "duration_seconds": seconds,
+#      "stages": {"stage": {"seconds": seconds, "count": n}}, "other_seconds": seconds, "slow": true,
+#      "profiled_by": "header", "sample" or null, "profile": [{"function": "file:line(name)", "calls": n, "own_seconds": seconds, "cumulative_seconds": seconds}]},
+#     ...
+#   ]
+# }
+@app.route('/api/slow_requests', methods = ['GET'])
+def get_slow_requests():
+    limit = get_count_arg(request.args, "limit", 20)
+    if limit is None or not 0 < limit <= SLOW_REQUESTS_KEPT:
+        return jsonify({"message": f"Invalid limit, expected 1 to {SLOW_REQUESTS_KEPT}."})
+    return jsonify({"threshold_seconds": SLOW_REQUEST_THRESHOLD_SECONDS, "slow_requests": get_worst_requests(limit)})
+
+# Returns the memory taken by the cached schedules of each pole and day, in bytes, and the totals.
+# {
+#   "poles": {"pole_link": {"YYYY-MM-DD": {"classrooms": n, "schedules": n, "model": {"schedules_texts": bytes, ..., "total": bytes}, "page": bytes}}},
+#   "total": {"model": bytes, "page": bytes}
+# }
+# "page" is the raw page kept in memory, 0 unless CACHE_SCHEDULE_PAGES.
+@app.route('/api/memory_report', methods = ['GET'])
+def get_memory_report():
+    with cache_lock:
+        cached = sorted(schedules_model_cache.items())
+        pages = {key: getsizeof(page) for key, page in src_schedules_page_cache.items()}
+    poles = {}
+    total = {"model": 0, "page": 0}
+    for (pole_link, day), pole_schedules in cached:
+        memory = pole_schedules_memory(pole_schedules)
+        page = pages.get((pole_link, day), 0)
+        poles.setdefault(pole_link, {})[day.isoformat()] = {
+            "classrooms": len(pole_schedules.classrooms),
+            "schedules": len(pole_schedules.table),
+            "model": memory,
+            "page": page,
+        }
+        total["model"] += memory["total"]
+        total["page"] += page
+    return jsonify({"poles": poles, "total": total})
 
 @app.route('/api/get_all_rooms_given_pole', methods = ['GET'])
 # Returns all the rooms given the pole name.
@@ -349,30 +1908,20 @@ def get_all_rooms_given_pole():
     else:
         return jsonify({"message": "Invalid pole."})
 
-    pole_link = ""
-    poles = fetch_poles_data()
-    if poles is None:
+    directory = get_poles_directory()
+    if directory is None:
         return jsonify({"message": "Error in fetching poles data."})
-    for pole in poles:
-        if pole_name.lower() in list(pole.keys())[0].lower():
-            pole_link = pole[list(pole.keys())[0]]
-
-    if pole_link == "":
+    pole_link = resolve_pole_link(directory, pole_name)
+    if pole_link is None:
         return jsonify({"message": "Invalid pole."})
 
-    rooms = []
-
-    src = selenium_get_schedule_page(pole_link)
-    if src is None:
+    pole_schedules = get_pole_schedules(pole_link)
+    if pole_schedules is None:
         return jsonify({"message": "Error in schedules data."})
-    infos = escrape_schedule_page(src)
-
-    for classroom in infos:
-        rooms.append(classroom["Classroom"])
 
-    return jsonify({"all_rooms": rooms})
+    return send_rendered(pole_schedules.all_rooms_response)
 
-# Returns all the schedules for a room given the pole name and the room name.
+# Returns all the schedules for a room given the pole name and the room name, of the given date (YYYY-MM-DD, default today).
 # {
 #  "classroom_name1": [
 #    "schedule1",
@@ -395,35 +1944,26 @@ def all_schedules_given_pole_and_room():
     else:
         return jsonify({"message": "Invalid classroom name for this pole."})
 
-    pole_link = ""
-    poles = fetch_poles_data()
-    if poles is None:
-        return jsonify({"message": "Error in fetching poles data."})
-    for pole in poles:
-        if pole_name.lower() in list(pole.keys())[0].lower():
-            pole_link = pole[list(pole.keys())[0]]
+    day = get_date_arg(request.args)
+    if day is None:
+        return jsonify({"message": "Invalid date, expected YYYY-MM-DD of a scraped day."})
 
-    if pole_link == "":
+    directory = get_poles_directory()
+    if directory is None:
+        return jsonify({"message": "Error in fetching poles data."})
+    pole_link = resolve_pole_link(directory, pole_name)
+    if pole_link is None:
         return jsonify({"message": "Invalid pole."})
 
-    src = selenium_get_schedule_page(pole_link)
-    if src is None:
+    pole_schedules = get_pole_schedules(pole_link, day)
+    if pole_schedules is None:
         return jsonify({"message": "Error in schedules data."})
-    infos = escrape_schedule_page(src)
-
-    return_classroom = ""
-    schedules = []
-    for classroom in infos:
-        current_classroom = classroom["Classroom"]
-        if current_classroom.lower() == classroom_name:
-            return_classroom = current_classroom
-            schedules = classroom[list(classroom.keys())[1]]
-            break
 
-    if return_classroom == "":
+    classroom = pole_schedules.classrooms_by_name.get(classroom_name)
+    if classroom is None:
         return jsonify({"message": "Invalid classroom name for this pole."})
 
-    return jsonify({return_classroom: schedules})
+    return jsonify({classroom.name: classroom.texts()})
 
 # Returns all the free rooms now given the pole name.
 # {
@@ -441,30 +1981,177 @@ def free_classrooms_now_given_pole():
     else:
         return jsonify({"message": "Invalid pole."})
 
-    pole_link = ""
-    poles = fetch_poles_data()
-    if poles is None:
+    directory = get_poles_directory()
+    if directory is None:
         return jsonify({"message": "Error in fetching poles data."})
-    for pole in poles:
-        if pole_name.lower() in list(pole.keys())[0].lower():
-            pole_link = pole[list(pole.keys())[0]]
+    pole_link = resolve_pole_link(directory, pole_name)
+    if pole_link is None:
+        return jsonify({"message": "Invalid pole."})
+
+    pole_schedules = get_pole_schedules(pole_link)
+    if pole_schedules is None:
+        return jsonify({"message": "Error in schedules data."})
+
+    # Valid until the end of the current minute.
+    return send_rendered(get_free_classrooms_now_response(pole_schedules), 60 - datetime.now().second)
+
+# Returns all the rooms free at the given date (YYYY-MM-DD, default today) and time (HH:MM, default now) and, if
+# minutes is given, that stay free for at least that many minutes, given the pole name.
+# {
+#  "free_classrooms": [
+#    {"classroom_name1": "next_lecture_start"},
+#    ...
+#  ]
+# }
+@app.route('/api/free_classrooms_at_given_pole', methods = ['GET'])
+def free_classrooms_at_given_pole():
+    pole_name = request.args.get('pole_name')
 
-    if pole_link == "":
+    if pole_name:
+        pole_name = pole_name.lower()
+    else:
         return jsonify({"message": "Invalid pole."})
 
-    src = selenium_get_schedule_page(pole_link)
-    if src is None:
+    minute = get_time_arg(request.args)
+    if minute is None:
+        return jsonify({"message": "Invalid time, expected HH:MM."})
+
+    min_free_minutes = get_count_arg(request.args, "minutes", 0)
+    if min_free_minutes is None:
+        return jsonify({"message": "Invalid minutes."})
+
+    day = get_date_arg(request.args)
+    if day is None:
+        return jsonify({"message": "Invalid date, expected YYYY-MM-DD of a scraped day."})
+
+    directory = get_poles_directory()
+    if directory is None:
+        return jsonify({"message": "Error in fetching poles data."})
+    pole_link = resolve_pole_link(directory, pole_name)
+    if pole_link is None:
+        return jsonify({"message": "Invalid pole."})
+
+    pole_schedules = get_pole_schedules(pole_link, day)
+    if pole_schedules is None:
         return jsonify({"message": "Error in schedules data."})
-    infos = escrape_schedule_page(src)
 
-    free_classrooms = get_free_classrooms_now(infos)
-    for classroom in free_classrooms:
-        for key, value in classroom.items():
-            classroom[key] = "Free until: " + str(classroom[key])
-            if "None" in classroom[key]:
-                classroom[key] = classroom[key].replace("None", "end of day")
+    free_classrooms = describe_free_classrooms(get_free_classrooms_at(pole_schedules.classrooms, minute, min_free_minutes))
+
+    return jsonify({"free_classrooms": free_classrooms})
+
+# Default and maximum of the limit arg of /api/free_classrooms_at_all_poles.
+SEARCH_FREE_CLASSROOMS_LIMIT = 50
+SEARCH_FREE_CLASSROOMS_MAX_LIMIT = 1000
+
+# Returns the rooms of all the poles (or only of the pole_name ones, it can be repeated) free at the given date
+# (YYYY-MM-DD, default today) and time (HH:MM, default now) and, if minutes is given, that stay free for at least
+# that many minutes. The longest free first, at most limit (default 50).
+# Only the poles with their schedules already in the cache are searched, no scrape is started.
+# {
+#  "time": "HH:MM",
+#  "free_classrooms": [
+#    {"pole_name": "pole_name1", "classroom": "classroom_name1", "free_until": "HH:MM" or null (end of day), "free_minutes": n or null},
+#    ...
+#  ]
+# }
+@app.route('/api/free_classrooms_at_all_poles', methods = ['GET'])
+def free_classrooms_at_all_poles():
+    minute = get_time_arg(request.args)
+    if minute is None:
+        return jsonify({"message": "Invalid time, expected HH:MM."})
+
+    min_free_minutes = get_count_arg(request.args, "minutes", 0)
+    if min_free_minutes is None:
+        return jsonify({"message": "Invalid minutes."})
+
+    limit = get_count_arg(request.args, "limit", SEARCH_FREE_CLASSROOMS_LIMIT)
+    if limit is None or not 0 < limit <= SEARCH_FREE_CLASSROOMS_MAX_LIMIT:
+        return jsonify({"message": f"Invalid limit, expected 1 to {SEARCH_FREE_CLASSROOMS_MAX_LIMIT}."})
+
+    day = get_date_arg(request.args)
+    if day is None:
+        return jsonify({"message": "Invalid date, expected YYYY-MM-DD of a scraped day."})
+
+    directory = get_poles_directory()
+    if directory is None:
+        return jsonify({"message": "Error in fetching poles data."})
+    pole_links = None
+    pole_names = [pole_name for pole_name in request.args.getlist('pole_name') if pole_name]
+    if pole_names:
+        pole_links = set()
+        for pole_name in pole_names:
+            pole_link = resolve_pole_link(directory, pole_name.lower())
+            if pole_link is None:
+                return jsonify({"message": "Invalid pole."})
+            pole_links.add(pole_link)
+
+    with cache_lock:
+        poles_schedules = [
+            pole_schedules for (pole_link, cached_day), pole_schedules in sorted(schedules_model_cache.items())
+            if cached_day == day and (pole_links is None or pole_link in pole_links)
+        ]
+
+    names = {pole_link: pole_name for pole in directory.poles for pole_name, pole_link in pole.items()}
+    free_classrooms = []
+    for free in search_free_classrooms(poles_schedules, minute, min_free_minutes, limit):
+        end_of_day = free.free_until == FREE_UNTIL_END_OF_DAY
+        free_classrooms.append({
+            "pole_name": names.get(free.pole_link, free.pole_link),
+            "classroom": free.classroom,
+            "free_until": None if end_of_day else format_minutes(free.free_until),
+            "free_minutes": None if end_of_day else int(free.free_until - minute),
+        })
+
+    return jsonify({"time": format_minutes(minute), "free_classrooms": free_classrooms})
+
+# Returns the free slots of a room from the given time (HH:MM, default now) to the end of the given date (YYYY-MM-DD,
+# default today), given the pole name and the room name.
+# {
+#  "classroom_name": [
+#    {"from": "HH:MM", "to": "HH:MM"},
+#    ...
+#    {"from": "HH:MM", "to": null}
+#  ]
+# }
+@app.route('/api/free_slots_given_pole_and_room', methods = ['GET'])
+def free_slots_given_pole_and_room():
+    pole_name = request.args.get('pole_name')
+    classroom_name = request.args.get("classroom")
+
+    if pole_name:
+        pole_name = pole_name.lower()
+    else:
+        return jsonify({"message": "Invalid pole."})
+
+    if classroom_name:
+        classroom_name = classroom_name.lower()
+    else:
+        return jsonify({"message": "Invalid classroom name for this pole."})
+
+    minute = get_time_arg(request.args)
+    if minute is None:
+        return jsonify({"message": "Invalid time, expected HH:MM."})
+
+    day = get_date_arg(request.args)
+    if day is None:
+        return jsonify({"message": "Invalid date, expected YYYY-MM-DD of a scraped day."})
+
+    directory = get_poles_directory()
+    if directory is None:
+        return jsonify({"message": "Error in fetching poles data."})
+    pole_link = resolve_pole_link(directory, pole_name)
+    if pole_link is None:
+        return jsonify({"message": "Invalid pole."})
 
-    return jsonify({"free_classrooms": free_classrooms}) 
+    pole_schedules = get_pole_schedules(pole_link, day)
+    if pole_schedules is None:
+        return jsonify({"message": "Error in schedules data."})
+
+    classroom = pole_schedules.classrooms_by_name.get(classroom_name)
+    if classroom is None:
+        return jsonify({"message": "Invalid classroom name for this pole."})
+
+    return jsonify({classroom.name: get_free_slots(classroom, minute)})
 
 # Returns the current (now) schedule or None for a given classroom in a given pole
 # {
@@ -485,111 +2172,926 @@ def current_schedule_given_pole_and_room():
     else:
         return jsonify({"message": "Invalid classroom name for this pole."})
 
-    pole_link = ""
-    poles = fetch_poles_data()
-    if poles is None:
+    directory = get_poles_directory()
+    if directory is None:
         return jsonify({"message": "Error in fetching poles data."})
-    for pole in poles:
-        if pole_name.lower() in list(pole.keys())[0].lower():
-            pole_link = pole[list(pole.keys())[0]]
-
-    if pole_link == "":
+    pole_link = resolve_pole_link(directory, pole_name)
+    if pole_link is None:
         return jsonify({"message": "Invalid pole."})
 
-    src = selenium_get_schedule_page(pole_link)
-    if src is None:
+    pole_schedules = get_pole_schedules(pole_link)
+    if pole_schedules is None:
         return jsonify({"message": "Error in schedules data."})
-    infos = escrape_schedule_page(src)
-
-    return_classroom = ""
-    schedules = []
-    for classroom in infos:
-        current_classroom = classroom["Classroom"]
-        if current_classroom.lower() == classroom_name:
-            return_classroom = current_classroom
-            schedules = classroom[list(classroom.keys())[1]]
-            break
 
-    if return_classroom == "":
+    classroom = pole_schedules.classrooms_by_name.get(classroom_name)
+    if classroom is None:
         return jsonify({"message": "Invalid classroom name for this pole."})
 
-    # Now.
-    time = datetime.now()
+    schedule = get_schedule_at(classroom, minutes_of_day(datetime.now()))
+    return_schedule = "" if schedule is None else schedule.text
+
+    return jsonify({classroom.name: return_schedule})
 
-    year = time.year
-    month = time.month
-    day = time.day
-    minute = time.minute
-    hour = time.hour
+# Facets of /api/batch_given_poles.
+BATCH_FACETS = ("rooms", "free_now", "current", "schedules")
+BATCH_DEFAULT_FACETS = "rooms,free_now"
 
-    return_schedule = ""
-    for schedule in schedules:
-        timestartend = schedule.split("|")[0]
+# Returns, in one response, the requested facets of more poles and rooms, all computed from the same schedules
+# snapshot and at the same minute.
+# pole_name can be repeated, classroom too (the classrooms are looked up in every pole, all the rooms of the pole if
+# missing) and facets is a comma separated list of:
+# rooms (all the rooms), free_now (free classrooms now), current (current schedule of the rooms), schedules (all the
+# schedules of the rooms). Default rooms,free_now.
+# {
+#  "time": "HH:MM",
+#  "poles": {
+#    "pole_name1": {
+#      "all_rooms": ["classroom_name1", ...],
+#      "free_classrooms": [{"classroom_name1": "next_lecture_start"}, ...],
+#      "classrooms": {"classroom_name1": {"current_schedule": "schedule", "schedules": ["schedule1", ...]}, ...},
+#      "invalid_classrooms": ["classroom_name", ...]
+#    },
+#    "pole_name2": {"message": "Invalid pole."},
+#    ...
+#  }
+# }
+@app.route('/api/batch_given_poles', methods = ['GET'])
+def batch_given_poles():
+    pole_names = [pole_name for pole_name in request.args.getlist('pole_name') if pole_name]
+    if not pole_names:
+        return jsonify({"message": "Invalid pole."})
+    classroom_names = [classroom_name.lower() for classroom_name in request.args.getlist("classroom") if classroom_name]
 
-        timestart = datetime.strptime(timestartend.split("-")[0].strip(), "%H:%M")
-        timeend = datetime.strptime(timestartend.split("-")[1].strip(), "%H:%M")
+    facets = [facet.strip() for facet in request.args.get("facets", BATCH_DEFAULT_FACETS).split(",") if facet.strip()]
+    if not facets or any(facet not in BATCH_FACETS for facet in facets):
+        return jsonify({"message": "Invalid facets, expected some of: " + ",".join(BATCH_FACETS) + "."})
 
-        timestart = datetime(year=year, month=month, day=day, hour=timestart.hour, minute=timestart.minute)
-        timeend = datetime(year=year, month=month, day=day, hour=timeend.hour, minute=timeend.minute)
+    directory = get_poles_directory()
+    if directory is None:
+        return jsonify({"message": "Error in fetching poles data."})
+    pole_links = {pole_name: resolve_pole_link(directory, pole_name.lower()) for pole_name in pole_names}
+    snapshot = get_poles_schedules_snapshot([pole_link for pole_link in pole_links.values() if pole_link is not None])
+    minute = int(minutes_of_day(datetime.now()))
+
+    poles = {}
+    for pole_name, pole_link in pole_links.items():
+        if pole_link is None:
+            poles[pole_name] = {"message": "Invalid pole."}
+            continue
+        pole_schedules = snapshot.get(pole_link)
+        if pole_schedules is None:
+            poles[pole_name] = {"message": "Error in schedules data."}
+            continue
+
+        pole = {}
+        if "rooms" in facets:
+            pole["all_rooms"] = [classroom.name for classroom in pole_schedules.classrooms]
+        if "free_now" in facets:
+            pole["free_classrooms"] = describe_free_classrooms(get_free_classrooms_at(pole_schedules.classrooms, minute))
+        if "current" in facets or "schedules" in facets:
+            if classroom_names:
+                classrooms = []
+                invalid_classrooms = []
+                for classroom_name in classroom_names:
+                    classroom = pole_schedules.classrooms_by_name.get(classroom_name)
+                    if classroom is None:
+                        invalid_classrooms.append(classroom_name)
+                    else:
+                        classrooms.append(classroom)
+                pole["invalid_classrooms"] = invalid_classrooms
+            else:
+                classrooms = pole_schedules.classrooms
+
+            pole["classrooms"] = {}
+            for classroom in classrooms:
+                values = {}
+                if "current" in facets:
+                    schedule = get_schedule_at(classroom, minute)
+                    values["current_schedule"] = "" if schedule is None else schedule.text
+                if "schedules" in facets:
+                    values["schedules"] = classroom.texts()
+                pole["classrooms"][classroom.name] = values
+        poles[pole_name] = pole
+
+    return jsonify({"time": format_minutes(minute), "poles": poles})
+
+# Streams (Server-Sent Events) the free classrooms of the pole: first all of them, then only what changes, when a
+# lecture starts or ends or when the schedules are refreshed.
+# event: free_classrooms
+# data: {"time": "HH:MM", "free_classrooms": [{"classroom_name1": "next_lecture_start"}, ...]}
+#
+# event: diff
+# data: {"time": "HH:MM", "freed": {"classroom_name1": "next_lecture_start"}, "occupied": ["classroom_name2"], "changed": {"classroom_name3": "next_lecture_start"}}
+# Each connection keeps a thread busy, serve it with threaded workers (gunicorn --threads) or with asgi.py.
+@app.route('/api/free_classrooms_stream_given_pole', methods = ['GET'])
+def free_classrooms_stream_given_pole():
+    pole_name = request.args.get('pole_name')
 
-        if timestart <= time <= timeend:
-            return_schedule = schedule
-            break
+    if pole_name:
+        pole_name = pole_name.lower()
+    else:
+        return jsonify({"message": "Invalid pole."})
 
+    directory = get_poles_directory()
+    if directory is None:
+        return jsonify({"message": "Error in fetching poles data."})
+    pole_link = resolve_pole_link(directory, pole_name)
+    if pole_link is None:
+        return jsonify({"message": "Invalid pole."})
 
-    return jsonify({return_classroom: return_schedule})
+    if get_pole_schedules(pole_link) is None:
+        return jsonify({"message": "Error in schedules data."})
 
-src_schedules_page_cache = {}
+    watch = subscribe_free_classrooms(pole_link)
+
+    def stream():
+        try:
+            version = 0
+            while True:
+                version, message = watch.messages_since(version)
+                if message:
+                    yield message
+                if not watch.wait_change(version, FREE_CLASSROOMS_STREAM_KEEPALIVE_SECONDS):
+                    # Also finds out, failing to write it, that the client went away.
+                    yield b": keepalive\n\n"
+        finally:
+            unsubscribe_free_classrooms(watch)
+
+    return Response(stream(), mimetype = "text/event-stream", headers = FREE_CLASSROOMS_STREAM_HEADERS)
+
+# Days scraped for each pole, starting from today: with 2 the tomorrow's schedules are already there at midnight.
+SCRAPE_DAYS = max(1, int(environ.get("SCRAPE_DAYS", "2")))
+
+def scraped_days() -> List[date]:
+    today = date.today()
+    return [today + timedelta(days = i) for i in range(SCRAPE_DAYS)]
+
+# (pole_link, day) -> raw schedule page source.
+# The models are built from the infos, the pages are only needed to parse them again with a different parser version
+# and the store keeps them for that: in memory they take more than the model, so they are kept only if asked.
+CACHE_SCHEDULE_PAGES = environ.get("CACHE_SCHEDULE_PAGES", "0") == "1"
+src_schedules_page_cache: Dict[Tuple[str, date], str] = {}
+# (pole_link, day) -> PoleSchedules, the parsed model of the page in src_schedules_page_cache.
+# The values are never modified in place, a refresh replaces the whole PoleSchedules object.
+# The past days are evicted by evict_past_days.
+schedules_model_cache: Dict[Tuple[str, date], PoleSchedules] = {}
 cache_lock = Lock()
+
+# Parses the schedule page source of the day (default today) and atomically swaps both the raw and the parsed caches of the pole.
+# Returns the PoleSchedules or None if the page cannot be parsed (the caches are left untouched).
+def update_pole_cache(pole_link, schedule_page_source, day: Optional[date] = None) -> Optional[PoleSchedules]:
+    # Parsing outside the lock, the handlers keep reading the previous model meanwhile.
+    try:
+        with timed(stage_duration, "parse"):
+            infos = escrape_schedule_page(schedule_page_source)
+    except Exception as e:
+        print(f"Parsing error for {pole_link}: {e}")
+        return None
+    if infos is None:
+        return None
+    return update_pole_cache_from_infos(pole_link, infos, schedule_page_source, day)
+
+# Same as update_pole_cache, from an "infos" list. Without the page source (the events feed) the cached page is dropped.
+# If the schedules are the same of the cached model, that model is kept and returned as is: no index rebuild,
+# no responses rendering and no new version in the store.
+def update_pole_cache_from_infos(pole_link, infos, schedule_page_source = None, day: Optional[date] = None) -> Optional[PoleSchedules]:
+    if day is None:
+        day = date.today()
+    fingerprint = infos_fingerprint(infos)
+    with cache_lock:
+        cached = schedules_model_cache.get((pole_link, day))
+    if cached is not None and cached.fingerprint == fingerprint:
+        touch_pole_schedules_in_store(pole_link, day)
+        return cached
+
+    with timed(stage_duration, "build_model"):
+        pole_schedules = build_pole_schedules_from_infos(pole_link, infos, day = day)
+    if pole_schedules is None:
+        return None
+    with cache_lock:
+        if schedule_page_source is None or not CACHE_SCHEDULE_PAGES:
+            # The cached page would be older than the model.
+            src_schedules_page_cache.pop((pole_link, day), None)
+        else:
+            src_schedules_page_cache[(pole_link, day)] = schedule_page_source
+        schedules_model_cache[(pole_link, day)] = pole_schedules
+    if day == date.today():
+        notify_pole_schedules_changed(pole_link)
+    save_pole_schedules_to_store(pole_schedules, schedule_page_source)
+    return pole_schedules
+
+# Gets the pole's schedules of the day (default today) with the configured backend and updates the caches.
+# Returns the new PoleSchedules, None on errors.
+def scrape_pole_schedules(pole_link, get_data_from_cache = True, day: Optional[date] = None) -> Optional[PoleSchedules]:
+    if day is None:
+        day = date.today()
+    if SCRAPER_BACKEND == "feed":
+        with timed(stage_duration, "scrape_feed"):
+            infos = feed_get_schedule_infos(pole_link, day)
+        scrapes_total.inc("feed", "error" if infos is None else "ok")
+        if infos is not None:
+            return update_pole_cache_from_infos(pole_link, infos, day = day)
+
+    if SCRAPER_BACKEND in ("replay", "http"):
+        with timed(stage_duration, "scrape_" + SCRAPER_BACKEND):
+            src = replay_schedule_page(pole_link, day) if SCRAPER_BACKEND == "replay" else http_get_schedule_page(pole_link, day)
+        scrapes_total.inc(SCRAPER_BACKEND, "error" if src is None else "ok")
+        if src is None:
+            return None
+        return update_pole_cache(pole_link, src, day)
+
+    with timed(stage_duration, "scrape_selenium"):
+        src = selenium_get_schedule_page(pole_link, get_data_from_cache, day)
+    scrapes_total.inc("selenium", "error" if src is None else "ok")
+    if src is None:
+        return None
+    return update_pole_cache(pole_link, src, day)
+
+# Drops from the caches the days before today (and from the store, if this process writes it).
+def evict_past_days():
+    today = date.today()
+    with cache_lock:
+        past = [key for key in schedules_model_cache if key[1] < today]
+        for key in past:
+            del schedules_model_cache[key]
+        for key in [key for key in src_schedules_page_cache if key[1] < today]:
+            del src_schedules_page_cache[key]
+    for key in [key for key in list(days_checked_at) if key[1] < today]:
+        days_checked_at.pop(key, None)
+    if past:
+        print(f"Evicted {len(past)} past days schedules.")
+    if is_refresher:
+        delete_past_days_from_store(today)
+
+# A call running in a SingleFlight, the other callers wait for its result.
+class InFlightCall:
+    def __init__(self):
+        self.done = Event()
+        self.result: Any = None
+
+# Runs at most one call per key at a time, the callers arriving while it runs get its result instead of running
+# it again (request coalescing).
+class SingleFlight:
+    # wait_stage is the stage (see stage_duration) of the time spent waiting for the call of another thread.
+    def __init__(self, wait_stage):
+        self.wait_stage = wait_stage
+        self.lock = Lock()
+        self.calls: Dict[str, InFlightCall] = {}
+
+    # Returns the result of function, or of the call already running for key. None if waiting for it takes more than
+    # timeout seconds (None timeout waits forever).
+    def do(self, key, function: Callable[[], Any], timeout = None) -> Any:
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = InFlightCall()
+                self.calls[key] = call
+
+        if not leader:
+            with timed(stage_duration, self.wait_stage):
+                if not call.done.wait(timeout):
+                    return None
+            return call.result
+
+        try:
+            call.result = function()
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.done.set()
+        return call.result
+
+# How long a request waits for a scrape of the same pole already running, when the pole is not cached yet.
+SCRAPE_WAIT_TIMEOUT_SECONDS = float(environ.get("SCRAPE_WAIT_TIMEOUT_SECONDS", "60"))
+
+# One scrape per pole and day at a time, shared by the requests missing the cache and by the refresh.
+# The total of the browsers running at the same time is bounded by the drivers pool (DRIVER_POOL_SIZE).
+scrapes_flight = SingleFlight("scrape_wait")
+
+# Returns the parsed schedules of the pole of the given day (default today), scraping and parsing it only if it is not
+# cached yet.
+def get_pole_schedules(pole_link, day: Optional[date] = None) -> Optional[PoleSchedules]:
+    if day is None:
+        day = date.today()
+    with cache_lock:
+        cached = schedules_model_cache.get((pole_link, day))
+    schedules_cache_lookups_total.inc("miss" if cached is None else "hit")
+    if cached is not None:
+        return cached
+
+    # Only the refresher launches browsers, the readers wait for the pole to appear in the shared store.
+    if not is_refresher:
+        return None
+
+    def scrape():
+        # Maybe cached by a scrape ended between the check above and this one.
+        with cache_lock:
+            cached = schedules_model_cache.get((pole_link, day))
+        if cached is not None:
+            return cached
+        return scrape_pole_schedules(pole_link, day = day)
+
+    return scrapes_flight.do((pole_link, day), scrape, SCRAPE_WAIT_TIMEOUT_SECONDS)
+
+# Returns pole_link -> today's PoleSchedules of the given poles, all read from the cache at the same time (after
+# scraping the ones not cached yet). The poles without schedules are missing.
+def get_poles_schedules_snapshot(pole_links: List[str]) -> Dict[str, PoleSchedules]:
+    day = date.today()
+    loaded = {}
+    for pole_link in pole_links:
+        pole_schedules = get_pole_schedules(pole_link, day)
+        if pole_schedules is not None:
+            loaded[pole_link] = pole_schedules
+    with cache_lock:
+        return {pole_link: schedules_model_cache.get((pole_link, day), pole_schedules) for pole_link, pole_schedules in loaded.items()}
+
+# Poles scraped at the same time by the refresh, more than the drivers in the pool would just wait for a driver.
+REFRESH_WORKERS = int(environ.get("REFRESH_WORKERS", str(driver_pool.max_size)))
+# Attempts after the first failed one, each waiting REFRESH_BACKOFF_SECONDS * 2^(attempt - 1) before starting.
+REFRESH_RETRIES = int(environ.get("REFRESH_RETRIES", "2"))
+REFRESH_BACKOFF_SECONDS = float(environ.get("REFRESH_BACKOFF_SECONDS", "2"))
+# Each pole is refreshed every 15 minutes during the teaching day (from Monday to Friday, TEACHING_HOURS)...
+REFRESH_PERIOD_SECONDS = int(environ.get("REFRESH_PERIOD_SECONDS", "900"))
+TEACHING_HOURS = tuple(int(hour) for hour in environ.get("TEACHING_HOURS", "7-20").split("-"))
+# ...and every 3 hours at night and in the weekends.
+REFRESH_QUIET_PERIOD_SECONDS = int(environ.get("REFRESH_QUIET_PERIOD_SECONDS", "10800"))
+# During the teaching day, the period of a pole doubles each time its schedules are found unchanged, up to this factor.
+REFRESH_UNCHANGED_MAX_FACTOR = int(environ.get("REFRESH_UNCHANGED_MAX_FACTOR", "4"))
+# How often the refresh thread looks for poles to refresh.
+REFRESH_TICK_SECONDS = 10
+
+class RefreshSummary(NamedTuple):
+    started_at: datetime
+    duration_seconds: float
+    # Refreshed poles, with changed schedules or not.
+    succeeded: List[str]
+    unchanged: List[str]
+    # pole_link -> last error.
+    failed: Dict[str, str]
+
+last_refresh_summary: Optional[RefreshSummary] = None
+
+# pole_link -> when the pole has to be refreshed again, poles not here are refreshed as soon as possible.
+next_refresh_at: Dict[str, datetime] = {}
+# pole_link -> how many refreshes in a row found the same schedules.
+unchanged_refreshes: Dict[str, int] = {}
+# (pole_link, day) -> last successful refresh of the days after today, refreshed every REFRESH_QUIET_PERIOD_SECONDS.
+days_checked_at: Dict[Tuple[str, date], datetime] = {}
+
+def is_teaching_time(time: datetime) -> bool:
+    return time.weekday() < 5 and TEACHING_HOURS[0] <= time.hour < TEACHING_HOURS[1]
+
+# When the pole has to be refreshed again, after a refresh ended at the given time.
+def schedule_next_refresh(pole_link, time: datetime) -> datetime:
+    if is_teaching_time(time):
+        factor = min(2 ** unchanged_refreshes.get(pole_link, 0), REFRESH_UNCHANGED_MAX_FACTOR)
+        seconds = min(REFRESH_PERIOD_SECONDS * factor, REFRESH_QUIET_PERIOD_SECONDS)
+    else:
+        seconds = REFRESH_QUIET_PERIOD_SECONDS
+    next_time = time + timedelta(seconds = seconds)
+    # The page shows the schedules of the current day, the new day ones are needed as soon as it starts.
+    next_midnight = datetime.combine(time.date() + timedelta(days = 1), datetime.min.time()) + timedelta(minutes = 1)
+    return min(next_time, next_midnight)
+
+# Scrapes and parses a pole's day updating its cache, retrying with exponential backoff.
+# Returns (None, changed) on success, (last error, False) otherwise.
+def refresh_pole_day(pole_link, day: date) -> Tuple[Optional[str], bool]:
+    with cache_lock:
+        previous = schedules_model_cache.get((pole_link, day))
+    error = None
+    for attempt in range(REFRESH_RETRIES + 1):
+        if attempt > 0:
+            sleep(REFRESH_BACKOFF_SECONDS * 2 ** (attempt - 1))
+        try:
+            pole_schedules = scrapes_flight.do((pole_link, day), lambda: scrape_pole_schedules(pole_link, False, day))
+            if pole_schedules is not None:
+                # The same model is kept if the schedules didn't change.
+                return None, pole_schedules is not previous
+            error = "Error in scraping or parsing the schedule page."
+        except Exception as e:
+            error = str(e)
+    return error, False
+
+# Refreshes today's schedules of the pole and the ones of the next days not refreshed since
+# REFRESH_QUIET_PERIOD_SECONDS. Returns today's (error, changed), the next days errors are only printed.
+def refresh_pole(pole_link) -> Tuple[Optional[str], bool]:
+    days = scraped_days()
+    result = refresh_pole_day(pole_link, days[0])
+    for day in days[1:]:
+        checked_at = days_checked_at.get((pole_link, day))
+        if checked_at is not None and (datetime.now() - checked_at).total_seconds() < REFRESH_QUIET_PERIOD_SECONDS:
+            continue
+        error, changed = refresh_pole_day(pole_link, day)
+        if error is None:
+            days_checked_at[(pole_link, day)] = datetime.now()
+        else:
+            print(f"Cache refresh error for {pole_link} on {day.isoformat()}: {error}")
+    return result
+
+# Refreshes the given poles in parallel, a failed pole doesn't stop the others, and schedules their next refresh.
+def refresh_poles(pole_links: List[str]) -> RefreshSummary:
+    global last_refresh_summary
+    started_at = datetime.now()
+    start = monotonic()
+
+    succeeded: List[str] = []
+    unchanged: List[str] = []
+    failed: Dict[str, str] = {}
+    with ThreadPoolExecutor(max_workers = max(1, REFRESH_WORKERS)) as executor:
+        for pole_link, (error, changed) in zip(pole_links, executor.map(refresh_pole, pole_links)):
+            if error is None:
+                succeeded.append(pole_link)
+                if changed:
+                    unchanged_refreshes[pole_link] = 0
+                else:
+                    unchanged.append(pole_link)
+                    unchanged_refreshes[pole_link] = unchanged_refreshes.get(pole_link, 0) + 1
+            else:
+                failed[pole_link] = error
+                unchanged_refreshes[pole_link] = 0
+            next_refresh_at[pole_link] = schedule_next_refresh(pole_link, datetime.now())
+
+    summary = RefreshSummary(started_at, round(monotonic() - start, 3), succeeded, unchanged, failed)
+    last_refresh_summary = summary
+    print(f"Cache refresh completed in {summary.duration_seconds}s: {len(succeeded) - len(unchanged)} poles updated, {len(unchanged)} unchanged, {len(failed)} failed.")
+    for pole_link, error in failed.items():
+        print(f"Cache refresh error for {pole_link}: {error}")
+    return summary
+
+def get_pole_links(directory: Optional[PolesDirectory]) -> List[str]:
+    pole_links: List[str] = []
+    if directory is not None:
+        for pole in directory.poles:
+            for key, value in pole.items():
+                pole_links.append(value)
+    return pole_links
+
+# Refreshes the poles directory and then all the poles.
+def refresh_all_poles() -> RefreshSummary:
+    directory = refresh_poles_directory()
+    if directory is None:
+        # Using the last known poles.
+        with poles_directory_lock:
+            directory = poles_directory
+    if directory is None:
+        print("Cache refresh error: error in fetching poles data.")
+    return refresh_poles(get_pole_links(directory))
+
+# Refreshes the poles directory if older than its TTL, and the poles whose next refresh time has come.
+# Returns the summary, None if there was nothing to refresh.
+def refresh_due_poles() -> Optional[RefreshSummary]:
+    evict_past_days()
+
+    with poles_directory_lock:
+        directory = poles_directory
+    if directory is None or (datetime.now() - directory.fetched_at).total_seconds() > POLES_DIRECTORY_TTL_SECONDS:
+        directory = refresh_poles_directory() or directory
+
+    now = datetime.now()
+    due = [pole_link for pole_link in get_pole_links(directory) if next_refresh_at.get(pole_link, now) <= now]
+    if not due:
+        return None
+    return refresh_poles(due)
+
 def src_schedules_page_cache_thread():
     # Initialization.
-    global src_schedules_page_cache
     try:
-        poles = fetch_poles_data()
-        if poles is None:
-            raise Exception()
-        for pole in poles:
-            for key, value in pole.items():
-                src = selenium_get_schedule_page(value, False)
-                if src is None:
-                    raise Exception()
-                with cache_lock:
-                    src_schedules_page_cache[value] = src
-        print("Cache initialization completed.")
+        refresh_all_poles()
     except Exception as e:
         print(f"Cache initialization error: {e}")
 
-    # 15 minutes.
-    clean_cache_after_seconds = 900
-    seconds_counter = 0
     while True:
-        sleep(1)
-        seconds_counter += 1
-        if seconds_counter >= clean_cache_after_seconds:
-            seconds_counter = 0
+        sleep(REFRESH_TICK_SECONDS)
+        try:
+            refresh_due_poles()
+        except Exception as e:
+            print(f"Cache update error: {e}")
+
+
+###########################################     FREE CLASSROOMS STREAM        ###########################################
+
+# Comment lines sent to the idle streams, so the proxies don't close them.
+FREE_CLASSROOMS_STREAM_KEEPALIVE_SECONDS = float(environ.get("FREE_CLASSROOMS_STREAM_KEEPALIVE_SECONDS", "25"))
+# No caches and no buffering in the proxies.
+FREE_CLASSROOMS_STREAM_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+# Diffs kept to catch up the slow subscribers, the ones further behind get again all the free classrooms.
+FREE_CLASSROOMS_STREAM_HISTORY = 16
+
+# The free classrooms of a pole, computed by free_classrooms_watches_thread when they can change (see
+# PoleSchedules.boundaries) and shared by all the streams of the pole. Each change gets a new version and its
+# diff, already rendered as an SSE message.
+class FreeClassroomsWatch:
+    def __init__(self, pole_link):
+        self.pole_link = pole_link
+        self.condition = Condition()
+        self.subscribers = 0
+        self.version = 0
+        # Classroom name -> "Free until: ..." (see describe_free_classrooms).
+        self.free: Dict[str, str] = {}
+        self.minute = 0
+        # Version -> SSE diff message leading to it.
+        self.diffs: Dict[int, bytes] = {}
+        # Called (from the watches thread) on each new version, used by the async streams.
+        self.listeners: List[Callable[[], None]] = []
+        # When the free classrooms have to be computed again, None if right now (the schedules changed).
+        self.next_check: Optional[datetime] = None
+
+    # Computes the free classrooms, on changes adds a new version. Returns whether something changed.
+    def update(self) -> bool:
+        with cache_lock:
+            pole_schedules = schedules_model_cache.get((self.pole_link, date.today()))
+        now = datetime.now()
+        if pole_schedules is None:
+            self.next_check = now + timedelta(seconds = REFRESH_TICK_SECONDS)
+            return False
+
+        minute = minutes_of_day(now)
+        free = {}
+        for classroom in describe_free_classrooms(get_free_classrooms_at(pole_schedules.classrooms, minute)):
+            free.update(classroom)
+
+        # After the next start or end (both included in the schedule), or at the start of the new day.
+        i = bisect_right(pole_schedules.boundaries, minute)
+        midnight = datetime.combine(now.date(), datetime.min.time())
+        if i < len(pole_schedules.boundaries):
+            self.next_check = midnight + timedelta(minutes = pole_schedules.boundaries[i], seconds = 1)
+        else:
+            self.next_check = midnight + timedelta(days = 1, seconds = 1)
+
+        with self.condition:
+            if self.version > 0 and free == self.free:
+                return False
+            diff = {
+                "time": format_minutes(minute),
+                "freed": {name: text for name, text in free.items() if name not in self.free},
+                "occupied": [name for name in self.free if name not in free],
+                "changed": {name: text for name, text in free.items() if name in self.free and self.free[name] != text},
+            }
+            self.version += 1
+            self.free = free
+            self.minute = minute
+            self.diffs[self.version] = sse_message("diff", self.version, diff)
+            self.diffs.pop(self.version - FREE_CLASSROOMS_STREAM_HISTORY, None)
+            self.condition.notify_all()
+            listeners = list(self.listeners)
+        for listener in listeners:
+            listener()
+        return True
+
+    # Returns the current version and the messages to send to a stream at the given version (0 if new): the diffs
+    # after it, or all the free classrooms if it is too far behind.
+    def messages_since(self, version) -> Tuple[int, bytes]:
+        with self.condition:
+            if version == self.version:
+                return version, b""
+            if all(v in self.diffs for v in range(version + 1, self.version + 1)) and version > 0:
+                return self.version, b"".join(self.diffs[v] for v in range(version + 1, self.version + 1))
+            free_classrooms = [{name: text} for name, text in self.free.items()]
+            return self.version, sse_message("free_classrooms", self.version, {"time": format_minutes(self.minute), "free_classrooms": free_classrooms})
+
+    # Waits for a version after the given one, returns False on timeout.
+    def wait_change(self, version, timeout) -> bool:
+        with self.condition:
+            return self.condition.wait_for(lambda: self.version != version, timeout)
+
+def sse_message(event, version, payload) -> bytes:
+    data = json.dumps(payload, sort_keys = True, separators = (",", ":"))
+    return f"event: {event}\nid: {version}\ndata: {data}\n\n".encode("utf-8")
+
+# pole_link -> FreeClassroomsWatch of the poles with at least a stream.
+free_classrooms_watches: Dict[str, FreeClassroomsWatch] = {}
+free_classrooms_watches_lock = Lock()
+# Set to wake up the watches thread before the next check (new watch, schedules changed).
+free_classrooms_watches_wakeup = Event()
+free_classrooms_watches_thread_started = False
+
+# Returns the watch of the pole, with its free classrooms already computed, for a new stream.
+def subscribe_free_classrooms(pole_link) -> FreeClassroomsWatch:
+    global free_classrooms_watches_thread_started
+    with free_classrooms_watches_lock:
+        watch = free_classrooms_watches.get(pole_link)
+        if watch is None:
+            watch = FreeClassroomsWatch(pole_link)
+            free_classrooms_watches[pole_link] = watch
+        watch.subscribers += 1
+        start = not free_classrooms_watches_thread_started
+        free_classrooms_watches_thread_started = True
+    if start:
+        Thread(target = free_classrooms_watches_thread, daemon = True).start()
+
+    with watch.condition:
+        new = watch.version == 0
+    if new:
+        watch.update()
+        free_classrooms_watches_wakeup.set()
+    return watch
+
+def unsubscribe_free_classrooms(watch: FreeClassroomsWatch):
+    with free_classrooms_watches_lock:
+        watch.subscribers -= 1
+        if watch.subscribers == 0 and free_classrooms_watches.get(watch.pole_link) is watch:
+            del free_classrooms_watches[watch.pole_link]
+
+# Called when the cached schedules of the pole are replaced.
+def notify_pole_schedules_changed(pole_link):
+    with free_classrooms_watches_lock:
+        watch = free_classrooms_watches.get(pole_link)
+    if watch is not None:
+        watch.next_check = None
+        free_classrooms_watches_wakeup.set()
+
+# Sleeps until the first watch to check, one computation per pole whatever the number of its streams.
+def free_classrooms_watches_thread():
+    while True:
+        # Cleared before looking at the watches, a wake up arriving meanwhile is not lost.
+        free_classrooms_watches_wakeup.clear()
+        with free_classrooms_watches_lock:
+            watches = list(free_classrooms_watches.values())
+
+        now = datetime.now()
+        for watch in watches:
+            if watch.next_check is None or watch.next_check <= now:
+                try:
+                    watch.update()
+                except Exception as e:
+                    print(f"Free classrooms stream error for {watch.pole_link}: {e}")
+                    watch.next_check = now + timedelta(seconds = REFRESH_TICK_SECONDS)
+
+        next_checks = [watch.next_check for watch in watches if watch.next_check is not None]
+        timeout = None
+        if next_checks:
+            timeout = max(0, (min(next_checks) - datetime.now()).total_seconds())
+        free_classrooms_watches_wakeup.wait(timeout)
+
+
+###########################################     SHARED STORE        ###########################################
+
+# With more processes serving the APIs (the gunicorn workers) only one of them, the refresher, scrapes the poles and
+# writes the parsed schedules (and the raw page they come from) to a SQLite file. The others, the readers, reload from there what changed and swap it in
+# their caches, so the requests never touch the file. Without a store path each process refreshes its own cache.
+# The store is also the snapshot loaded at startup, to answer with the last known schedules while the first refresh runs.
+# Set it empty to disable it.
+SCHEDULES_STORE_PATH = environ.get("SCHEDULES_STORE_PATH", path.join(path.dirname(path.abspath(__file__)), "schedules_cache.sqlite3")) or None
+# "auto": the first process getting the store lock is the refresher, the others are readers and take its place if it dies.
+# "reader": never refreshes, to be used when refresher.py runs as a separate process.
+SCHEDULES_ROLE = environ.get("SCHEDULES_ROLE", "auto")
+STORE_RELOAD_SECONDS = float(environ.get("STORE_RELOAD_SECONDS", "2"))
+
+# Whether this process scrapes (always, without a store).
+is_refresher = SCHEDULES_STORE_PATH is None
+# Kept open while this process is the refresher, the lock is released by the OS if the process dies.
+refresher_lock_file = None
+
+SCHEDULES_TABLE_SQL = (
+    "CREATE TABLE IF NOT EXISTS {table} (pole_link TEXT NOT NULL, day TEXT NOT NULL, infos TEXT NOT NULL, updated_at TEXT NOT NULL, "
+    "version INTEGER NOT NULL, page_source TEXT, checked_at TEXT, model BLOB, PRIMARY KEY (pole_link, day))"
+)
+
+class SchedulesStore:
+    def __init__(self, path):
+        self.lock = Lock()
+        self.connection = sqlite3.connect(path, timeout = 30, check_same_thread = False)
+        with self.lock, self.connection:
+            # The readers don't block the refresher writes.
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS poles (id INTEGER PRIMARY KEY CHECK (id = 0), poles TEXT NOT NULL, fetched_at TEXT NOT NULL)")
+            # version grows at each write, the readers load only the rows newer than the last they saw.
+            # page_source is NULL when the schedules come from the events feed, checked_at is the last refresh of
+            # the pole, also when it found the same schedules (updated_at is the last change). model is the
+            # serialized PoleSchedules (see serialize_pole_schedules), loaded without parsing the infos again.
+            self.connection.execute(SCHEDULES_TABLE_SQL.format(table = "schedules"))
+            columns = [row[1] for row in self.connection.execute("PRAGMA table_info(schedules)")]
+            # Stores created before the raw pages were saved.
+            if "page_source" not in columns:
+                self.connection.execute("ALTER TABLE schedules ADD COLUMN page_source TEXT")
+            if "checked_at" not in columns:
+                self.connection.execute("ALTER TABLE schedules ADD COLUMN checked_at TEXT")
+            if "model" not in columns:
+                self.connection.execute("ALTER TABLE schedules ADD COLUMN model BLOB")
+            # Stores created before the multi-day cache, with a row per pole of the day it was checked.
+            if "day" not in columns:
+                self.connection.execute(SCHEDULES_TABLE_SQL.format(table = "schedules_by_day"))
+                self.connection.execute(
+                    "INSERT INTO schedules_by_day (pole_link, day, infos, updated_at, version, page_source, checked_at) "
+                    "SELECT pole_link, substr(COALESCE(checked_at, updated_at), 1, 10), infos, updated_at, version, page_source, checked_at FROM schedules"
+                )
+                self.connection.execute("DROP TABLE schedules")
+                self.connection.execute("ALTER TABLE schedules_by_day RENAME TO schedules")
+            # The last version given, it only grows: the rows holding the highest versions can be deleted (the past days)
+            # and a version given again would be skipped by the readers that already loaded it.
+            self.connection.execute("CREATE TABLE IF NOT EXISTS schedules_version (id INTEGER PRIMARY KEY CHECK (id = 0), version INTEGER NOT NULL)")
+            self.connection.execute("INSERT OR IGNORE INTO schedules_version (id, version) SELECT 0, COALESCE(MAX(version), 0) FROM schedules")
+
+    def save_poles(self, poles, fetched_at: datetime):
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO poles (id, poles, fetched_at) VALUES (0, ?, ?)",
+                (json.dumps(poles), fetched_at.isoformat()),
+            )
+
+    # Returns (poles, fetched_at), None if the poles were never saved.
+    def load_poles(self) -> Optional[Tuple[List[Dict[str, str]], datetime]]:
+        with self.lock:
+            row = self.connection.execute("SELECT poles, fetched_at FROM poles WHERE id = 0").fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0]), datetime.fromisoformat(row[1])
+
+    def save_schedules(self, pole_link, day: date, infos, updated_at: datetime, page_source = None, model: Optional[bytes] = None):
+        with self.lock, self.connection:
+            self.connection.execute("UPDATE schedules_version SET version = version + 1 WHERE id = 0")
+            self.connection.execute(
+                "INSERT OR REPLACE INTO schedules (pole_link, day, infos, updated_at, version, page_source, checked_at, model) "
+                "VALUES (?, ?, ?, ?, (SELECT version FROM schedules_version WHERE id = 0), ?, ?, ?)",
+                (pole_link, day.isoformat(), json.dumps(infos), updated_at.isoformat(), page_source, updated_at.isoformat(), model),
+            )
+
+    # Records a refresh that found the same schedules, without a new version (the readers have nothing to reload).
+    def touch_schedules(self, pole_link, day: date, checked_at: datetime):
+        with self.lock, self.connection:
+            self.connection.execute("UPDATE schedules SET checked_at = ? WHERE pole_link = ? AND day = ?", (checked_at.isoformat(), pole_link, day.isoformat()))
+
+    def delete_schedules_before(self, day: date):
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM schedules WHERE day < ?", (day.isoformat(),))
+
+    # Returns [(pole_link, day, infos, updated_at, version, page_source, model)] of the poles' days saved after the
+    # given version and not before min_day. infos is the JSON text, parsed by the caller only if the model cannot be
+    # used. page_source is loaded only if asked, the readers don't need it.
+    def load_schedules_since(self, version, min_day: date, with_page_sources = False) -> List[Tuple[str, date, str, datetime, int, Optional[str], Optional[bytes]]]:
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT pole_link, day, infos, updated_at, version, " + ("page_source" if with_page_sources else "NULL") +
+                ", model FROM schedules WHERE version > ? AND day >= ? ORDER BY version", (version, min_day.isoformat())
+            ).fetchall()
+        return [
+            (pole_link, date.fromisoformat(day), infos, datetime.fromisoformat(updated_at), version, page_source, model)
+            for pole_link, day, infos, updated_at, version, page_source, model in rows
+        ]
+
+schedules_store: Optional[SchedulesStore] = None
+
+# Opened by the entry points (main, run_refresher), importing the module doesn't create the store file.
+# If the store cannot be opened (e.g. a read-only directory) the process refreshes its own cache, as without a store path.
+def open_schedules_store():
+    global schedules_store, is_refresher
+    if schedules_store is None and SCHEDULES_STORE_PATH is not None:
+        try:
+            schedules_store = SchedulesStore(SCHEDULES_STORE_PATH)
+        except (sqlite3.Error, OSError) as e:
+            print(f"Store error opening {SCHEDULES_STORE_PATH}, refreshing the cache in this process: {e}")
+            schedules_store = None
+            is_refresher = True
+
+def save_poles_directory_to_store(directory: PolesDirectory):
+    if schedules_store is None:
+        return
+    try:
+        schedules_store.save_poles(directory.poles, directory.fetched_at)
+    except Exception as e:
+        print(f"Store error saving the poles: {e}")
+
+def touch_pole_schedules_in_store(pole_link, day: date):
+    if schedules_store is None:
+        return
+    try:
+        schedules_store.touch_schedules(pole_link, day, datetime.now())
+    except Exception as e:
+        print(f"Store error touching {pole_link}: {e}")
+
+def delete_past_days_from_store(today: date):
+    if schedules_store is None:
+        return
+    try:
+        schedules_store.delete_schedules_before(today)
+    except Exception as e:
+        print(f"Store error deleting the past days: {e}")
+
+def save_pole_schedules_to_store(pole_schedules: PoleSchedules, page_source = None):
+    if schedules_store is None:
+        return
+    try:
+        schedules_store.save_schedules(
+            pole_schedules.pole_link, pole_schedules.day, pole_schedules_to_infos(pole_schedules), pole_schedules.updated_at,
+            page_source, serialize_pole_schedules(pole_schedules),
+        )
+    except Exception as e:
+        print(f"Store error saving {pole_schedules.pole_link}: {e}")
+
+# Tries to become the refresher taking the store lock (without waiting, unless blocking).
+def acquire_refresher_lock(blocking = False) -> bool:
+    global refresher_lock_file, is_refresher
+    if fcntl is None:
+        is_refresher = True
+        return True
+
+    lock_file = open(SCHEDULES_STORE_PATH + ".lock", "a")
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return False
+    refresher_lock_file = lock_file
+    is_refresher = True
+    return True
+
+# Loads from the store the poles directory, if changed, and the poles saved after loaded_version.
+# With with_page_sources (the startup snapshot load) the raw pages are loaded too, and the schedules of past days skipped.
+# Returns the last loaded version.
+def reload_from_store(loaded_version, with_page_sources = False) -> int:
+    poles = schedules_store.load_poles()
+    if poles is not None:
+        with poles_directory_lock:
+            current = poles_directory
+        if current is None or current.fetched_at != poles[1]:
+            swap_poles_directory(build_poles_directory(poles[0], poles[1]))
+
+    today = date.today()
+    for pole_link, day, infos, updated_at, version, page_source, model in schedules_store.load_schedules_since(loaded_version, today, with_page_sources):
+        loaded_version = version
+
+        pole_schedules = None
+        if model is not None:
             try:
-                poles = fetch_poles_data()
-                if poles is None:
-                    raise Exception()
-                for pole in poles:
-                    for key, value in pole.items():
-                        src = selenium_get_schedule_page(value, False)
-                        if src is None:
-                            raise Exception()
-                        with cache_lock:
-                            src_schedules_page_cache[value] = src
-                print("Cache update completed.")
+                pole_schedules = deserialize_pole_schedules(pole_link, day, updated_at, model)
             except Exception as e:
-                print(f"Cache update error: {e}")
+                print(f"Store error loading the model of {pole_link}: {e}")
+        if pole_schedules is None:
+            # Saved before the models were stored, or with a different format.
+            pole_schedules = build_pole_schedules_from_infos(pole_link, json.loads(infos), updated_at, day)
+        if pole_schedules is None and page_source is not None:
+            # Saved by a different version of the parser, parsing again the raw page.
+            pole_schedules = build_pole_schedules(pole_link, page_source, day, updated_at)
+        if pole_schedules is None:
+            continue
+
+        with cache_lock:
+            if page_source is not None and CACHE_SCHEDULE_PAGES:
+                src_schedules_page_cache[(pole_link, day)] = page_source
+            schedules_model_cache[(pole_link, day)] = pole_schedules
+        if day == today:
+            notify_pole_schedules_changed(pole_link)
 
+    return loaded_version
+
+# Loads the last snapshot of the caches saved in the store, returns its version.
+def load_snapshot() -> int:
+    try:
+        loaded_version = reload_from_store(0, with_page_sources = True)
+    except Exception as e:
+        print(f"Snapshot load error: {e}")
+        return 0
+    with cache_lock:
+        loaded = list(schedules_model_cache.values())
+    if loaded:
+        oldest = min(pole_schedules.updated_at for pole_schedules in loaded)
+        print(f"Loaded {len(loaded)} poles' days from the snapshot, the oldest updated at {oldest.isoformat(timespec = 'seconds')}.")
+    return loaded_version
+
+# Readers loop, keeps the caches in sync with the store and, in "auto" role, becomes the refresher when possible.
+def store_reload_thread(loaded_version = 0):
+    while True:
+        try:
+            loaded_version = reload_from_store(loaded_version)
+            evict_past_days()
+        except Exception as e:
+            print(f"Store reload error: {e}")
+
+        if SCHEDULES_ROLE == "auto" and acquire_refresher_lock():
+            print("Became the schedules refresher.")
+            src_schedules_page_cache_thread()
+            return
+
+        sleep(STORE_RELOAD_SECONDS)
 
 def main():
-    print("Starting schedules cache thread...")
-    cache_thread = Thread(target = src_schedules_page_cache_thread, daemon=True)
-    cache_thread.start()
-    print("Cache thread started.")
+    open_schedules_store()
+    if schedules_store is not None:
+        # Warm start, the requests are answered from the last snapshot while the first refresh runs.
+        loaded_version = load_snapshot()
+        print("Starting schedules store reload thread...")
+        store_thread = Thread(target = store_reload_thread, args = (loaded_version,), daemon = True)
+        store_thread.start()
+        print("Store reload thread started.")
+    else:
+        print("Starting schedules cache thread...")
+        cache_thread = Thread(target = src_schedules_page_cache_thread, daemon=True)
+        cache_thread.start()
+        print("Cache thread started.")
     print("Initialization completed, starting serving requests.")
 
+# Entry point of refresher.py, refreshes the store in foreground without serving the APIs.
+def run_refresher():
+    open_schedules_store()
+    if schedules_store is None:
+        print("SCHEDULES_STORE_PATH is required to run the refresher.")
+        return
+    print("Waiting to become the schedules refresher...")
+    acquire_refresher_lock(blocking = True)
+    print("Became the schedules refresher.")
+    src_schedules_page_cache_thread()
+
 
 # Main entry point of the application.
 if __name__ == '__main__':
@@ -603,6 +3105,14 @@ if __name__ == '__main__':
     # In production, use Gunicorn:
     # pip install gunicorn
     # python3 -m gunicorn --bind 127.0.0.1:8000 wsgi:app
+    # With more workers, the cache is shared (APIs/schedules_cache.sqlite3 or SCHEDULES_STORE_PATH) and only one of them scrapes:
+    # python3 -m gunicorn --workers 4 --bind 127.0.0.1:8000 wsgi:app
+    # Or scrape in a separate process and let all the workers only read:
+    # SCHEDULES_STORE_PATH=/var/tmp/unipi-schedules.sqlite3 python3 refresher.py
+    # SCHEDULES_STORE_PATH=/var/tmp/unipi-schedules.sqlite3 SCHEDULES_ROLE=reader python3 -m gunicorn --workers 4 --bind 127.0.0.1:8000 wsgi:app
+    # Or, asyncio based, without blocking on the university website (see asgi.py):
+    # pip install uvicorn httpx
+    # python3 -m uvicorn --workers 4 --host 127.0.0.1 --port 8000 asgi:application
 
     # Apache proxy forwards the requests from 54321 port to Gunicorn on 8000 port.
 
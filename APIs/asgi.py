@@ -0,0 +1,346 @@
+from apis import *
+# The globals apis rebinds at runtime (is_refresher, poles_directory, poles_directory_refreshing) are read and written
+# through the module, the star import only copies their values at import time.
+import apis
+
+import asyncio
+from io import BytesIO
+from sys import stderr
+from urllib.parse import parse_qs
+
+import httpx
+
+# Asyncio serving mode, same routes of wsgi.py.
+# The Flask views answer from the caches in microseconds, what can block are the web requests and the scrapes behind a
+# cache miss. Here those are done before calling the view: the web requests with an async client (connection pooling)
+# and the scrapes in a bounded executor, so the event loop keeps serving the other requests meanwhile and then calls
+# the view that finds everything in the caches.
+# pip install uvicorn httpx
+# python3 -m uvicorn --host 127.0.0.1 --port 8000 asgi:application
+# With more workers, the cache is shared as with gunicorn (see SCHEDULES_STORE_PATH):
+# python3 -m uvicorn --workers 4 --host 127.0.0.1 --port 8000 asgi:application
+
+# Threads running the blocking work: the Selenium scrapes, the store writes and the views that could not be made
+# non-blocking (e.g. the scrape failed and the view would retry it). More requests just wait for a thread.
+ASGI_BLOCKING_WORKERS = int(environ.get("ASGI_BLOCKING_WORKERS", str(max(4, 2 * driver_pool.max_size))))
+# Connections kept open to the university website.
+ASGI_HTTP_MAX_CONNECTIONS = int(environ.get("ASGI_HTTP_MAX_CONNECTIONS", "20"))
+ASGI_HTTP_TIMEOUT_SECONDS = float(environ.get("ASGI_HTTP_TIMEOUT_SECONDS", "15"))
+
+blocking_executor = ThreadPoolExecutor(max_workers = ASGI_BLOCKING_WORKERS, thread_name_prefix = "asgi-blocking")
+
+http_client: Optional[httpx.AsyncClient] = None
+
+# Running loads, shared by the concurrent requests needing them: the poles directory and (pole_link, day) -> schedules.
+poles_directory_task: Optional[asyncio.Task] = None
+pole_schedules_tasks: Dict[Tuple[str, date], asyncio.Task] = {}
+
+def get_http_client() -> httpx.AsyncClient:
+    global http_client
+    if http_client is None:
+        http_client = httpx.AsyncClient(
+            timeout = ASGI_HTTP_TIMEOUT_SECONDS,
+            limits = httpx.Limits(max_connections = ASGI_HTTP_MAX_CONNECTIONS, max_keepalive_connections = ASGI_HTTP_MAX_CONNECTIONS),
+        )
+    return http_client
+
+async def run_blocking(function, *args):
+    return await asyncio.get_running_loop().run_in_executor(blocking_executor, function, *args)
+
+# Same as fetch_poles_data, with the async client.
+async def async_fetch_poles_data() -> Optional[List[Dict[str, str]]]:
+    if SCRAPER_BACKEND == "replay":
+        # From the disk.
+        return await run_blocking(fetch_poles_data)
+    try:
+        page = await get_http_client().get(POLES_DATA_URL)
+    except Exception:
+        print("Error in web request to fetch poles data.")
+        return None
+    if page.status_code != 200:
+        print("Error in web request to fetch poles data. Wrong status code.")
+        return None
+    if SCRAPE_RECORD_DIR is not None:
+        await run_blocking(record_poles_page, page.content)
+    return parse_poles_data(page.content)
+
+# Same as refresh_poles_directory, with the async client.
+async def async_refresh_poles_directory() -> Optional[PolesDirectory]:
+    try:
+        poles = await async_fetch_poles_data()
+        if poles is None:
+            return None
+        # Also writes the store.
+        return await run_blocking(update_poles_directory, poles)
+    finally:
+        with poles_directory_lock:
+            apis.poles_directory_refreshing = False
+
+# Same as get_poles_directory, without blocking the event loop.
+async def async_get_poles_directory() -> Optional[PolesDirectory]:
+    global poles_directory_task
+    with poles_directory_lock:
+        directory = apis.poles_directory
+
+    if not apis.is_refresher:
+        if directory is None:
+            # Loaded by the store reload thread.
+            await run_blocking(poles_directory_loaded.wait, POLES_DIRECTORY_FIRST_LOAD_TIMEOUT_SECONDS)
+            with poles_directory_lock:
+                directory = apis.poles_directory
+        return directory
+
+    if directory is None or (datetime.now() - directory.fetched_at).total_seconds() > POLES_DIRECTORY_TTL_SECONDS:
+        with poles_directory_lock:
+            # Also keeps get_poles_directory from starting its background thread.
+            start = not apis.poles_directory_refreshing
+            apis.poles_directory_refreshing = True
+        if start:
+            poles_directory_task = asyncio.ensure_future(async_refresh_poles_directory())
+        task = poles_directory_task
+        if directory is None:
+            if task is not None and not task.done():
+                # Without a directory the request has to wait for it.
+                try:
+                    await asyncio.wait_for(asyncio.shield(task), POLES_DIRECTORY_FIRST_LOAD_TIMEOUT_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+            else:
+                # Started by the refresh thread.
+                await run_blocking(poles_directory_loaded.wait, POLES_DIRECTORY_FIRST_LOAD_TIMEOUT_SECONDS)
+            with poles_directory_lock:
+                directory = apis.poles_directory
+    return directory
+
+# Same as feed_get_schedule_infos, with the async client.
+async def async_feed_get_schedule_infos(pole_link, day: date) -> Optional[List[Dict[str, Union[str, List[str]]]]]:
+    contract = get_feed_contract(pole_link)
+    if contract is None:
+        return None
+    try:
+        response = await get_http_client().get(feed_url_for_day(contract, day), timeout = FEED_TIMEOUT_SECONDS)
+    except Exception as e:
+        print(f"Events feed error for {pole_link}: {e}")
+        return None
+    return feed_response_to_infos(pole_link, contract, day, response.status_code, response.json)
+
+# Scrapes the pole's day (cache miss): from the events feed with the async client, else with Selenium in the executor.
+async def async_load_pole_schedules(pole_link, day: date) -> Optional[PoleSchedules]:
+    infos = await async_feed_get_schedule_infos(pole_link, day)
+    if infos is not None:
+        pole_schedules = await run_blocking(update_pole_cache_from_infos, pole_link, infos, None, day)
+        if pole_schedules is not None:
+            return pole_schedules
+    # Coalesced with the refresh and the other workers' views by scrapes_flight.
+    return await run_blocking(get_pole_schedules, pole_link, day)
+
+# Same as get_pole_schedules, without blocking the event loop.
+async def async_get_pole_schedules(pole_link, day: date) -> Optional[PoleSchedules]:
+    key = (pole_link, day)
+    with cache_lock:
+        pole_schedules = schedules_model_cache.get(key)
+    if pole_schedules is not None or not apis.is_refresher:
+        return pole_schedules
+
+    task = pole_schedules_tasks.get(key)
+    if task is None:
+        task = asyncio.ensure_future(async_load_pole_schedules(pole_link, day))
+        pole_schedules_tasks[key] = task
+        task.add_done_callback(lambda _: pole_schedules_tasks.pop(key, None))
+    try:
+        return await asyncio.wait_for(asyncio.shield(task), SCRAPE_WAIT_TIMEOUT_SECONDS)
+    except asyncio.TimeoutError:
+        return None
+
+# Routes needing the poles directory also without a pole_name.
+POLES_DIRECTORY_PATHS = {"/api/poles_data", "/api/free_classrooms_at_all_poles"}
+
+# Loads what the view of the request needs. Returns whether the view can then run without blocking.
+async def prepare_request(path, query: Dict[str, List[str]]) -> bool:
+    pole_names = query.get("pole_name", [])
+    if path not in POLES_DIRECTORY_PATHS and not pole_names:
+        return True
+
+    # An invalid date is answered by the view before looking for the schedules.
+    day = get_date_arg({"date": query.get("date", [""])[0]}) or date.today()
+
+    directory = await async_get_poles_directory()
+    if directory is None:
+        return False
+    for pole_name in pole_names:
+        pole_link = resolve_pole_link(directory, pole_name.lower())
+        if pole_link is None:
+            # The view answers "Invalid pole.".
+            continue
+        if await async_get_pole_schedules(pole_link, day) is None and apis.is_refresher:
+            # The view would scrape again.
+            return False
+    return True
+
+def build_environ(scope, body: bytes) -> Dict[str, Any]:
+    server = scope.get("server") or ("localhost", 80)
+    client = scope.get("client") or ("", 0)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf-8").decode("latin-1"),
+        "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": scope["query_string"].decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": "HTTP/" + scope.get("http_version", "1.1"),
+        "REMOTE_ADDR": client[0],
+        "CONTENT_LENGTH": str(len(body)),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": BytesIO(body),
+        "wsgi.errors": stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    for name, value in scope.get("headers", []):
+        name = name.decode("latin-1")
+        value = value.decode("latin-1")
+        if name == "content-length":
+            continue
+        if name == "content-type":
+            environ["CONTENT_TYPE"] = value
+            continue
+        key = "HTTP_" + name.upper().replace("-", "_")
+        environ[key] = environ[key] + "," + value if key in environ else value
+    return environ
+
+# Runs the Flask app on the request, returns (status, headers, body).
+def call_flask(environ) -> Tuple[int, List[Tuple[bytes, bytes]], bytes]:
+    started = {}
+
+    def start_response(status, headers, exc_info = None):
+        started["status"] = int(status.split(" ", 1)[0])
+        started["headers"] = [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in headers]
+
+    chunks = app(environ, start_response)
+    try:
+        body = b"".join(chunks)
+    finally:
+        if hasattr(chunks, "close"):
+            chunks.close()
+    return started["status"], started["headers"], body
+
+# A JSON response as the views answer it, returns (status, headers, body).
+def json_response(environ, payload) -> Tuple[int, List[Tuple[bytes, bytes]], bytes]:
+    with app.request_context(environ):
+        response = app.process_response(jsonify(payload))
+    headers = [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in response.headers.items()]
+    return response.status_code, headers, response.get_data()
+
+# Response headers of a stream, with the ones the Flask app adds to all the responses (CORS).
+def stream_response_headers(environ) -> List[Tuple[bytes, bytes]]:
+    with app.request_context(environ):
+        response = app.process_response(Response(mimetype = "text/event-stream", headers = FREE_CLASSROOMS_STREAM_HEADERS))
+    return [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in response.headers.items() if name.lower() != "content-length"]
+
+async def wait_disconnect(receive):
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+# Same as the free_classrooms_stream_given_pole view, the stream waits for the changes in the event loop instead of
+# in a thread. The view is never called: its response never ends and call_flask would wait for it forever.
+# Without ready (see prepare_request) what is missing is loaded in the executor, as the view would do.
+async def stream_free_classrooms(scope, receive, send, environ, query, ready):
+    pole_name = query.get("pole_name", [""])[0].lower()
+    if not pole_name:
+        return json_response(environ, {"message": "Invalid pole."})
+    if ready:
+        with poles_directory_lock:
+            directory = apis.poles_directory
+    else:
+        directory = await run_blocking(get_poles_directory)
+    if directory is None:
+        return json_response(environ, {"message": "Error in fetching poles data."})
+    pole_link = resolve_pole_link(directory, pole_name)
+    if pole_link is None:
+        return json_response(environ, {"message": "Invalid pole."})
+    with cache_lock:
+        pole_schedules = schedules_model_cache.get((pole_link, date.today()))
+    if pole_schedules is None and not ready:
+        pole_schedules = await run_blocking(get_pole_schedules, pole_link)
+    if pole_schedules is None:
+        return json_response(environ, {"message": "Error in schedules data."})
+
+    loop = asyncio.get_running_loop()
+    changed = asyncio.Event()
+    listener = lambda: loop.call_soon_threadsafe(changed.set)
+    watch = subscribe_free_classrooms(pole_link)
+    with watch.condition:
+        watch.listeners.append(listener)
+    disconnected = asyncio.ensure_future(wait_disconnect(receive))
+    try:
+        await send({"type": "http.response.start", "status": 200, "headers": stream_response_headers(environ)})
+        version = 0
+        while True:
+            changed.clear()
+            version, message = watch.messages_since(version)
+            if message:
+                await send({"type": "http.response.body", "body": message, "more_body": True})
+            waiter = asyncio.ensure_future(changed.wait())
+            done, _ = await asyncio.wait({waiter, disconnected}, timeout = FREE_CLASSROOMS_STREAM_KEEPALIVE_SECONDS, return_when = asyncio.FIRST_COMPLETED)
+            if not waiter.done():
+                waiter.cancel()
+            if disconnected in done:
+                break
+            if not done:
+                await send({"type": "http.response.body", "body": b": keepalive\n\n", "more_body": True})
+    finally:
+        disconnected.cancel()
+        with watch.condition:
+            watch.listeners.remove(listener)
+        unsubscribe_free_classrooms(watch)
+    return None
+
+async def handle_http(scope, receive, send):
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body", False):
+            break
+
+    query = parse_qs(scope["query_string"].decode("latin-1"))
+    environ = build_environ(scope, body)
+    ready = await prepare_request(scope["path"], query)
+    if scope["path"] == "/api/free_classrooms_stream_given_pole" and scope["method"] == "GET":
+        response = await stream_free_classrooms(scope, receive, send, environ, query, ready)
+        if response is None:
+            return
+        status, headers, response_body = response
+    elif ready:
+        status, headers, response_body = call_flask(environ)
+    else:
+        status, headers, response_body = await run_blocking(call_flask, environ)
+
+    await send({"type": "http.response.start", "status": status, "headers": headers})
+    await send({"type": "http.response.body", "body": response_body})
+
+async def handle_lifespan(scope, receive, send):
+    global http_client
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            get_http_client()
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            if http_client is not None:
+                await http_client.aclose()
+                http_client = None
+            blocking_executor.shutdown(wait = False)
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+async def application(scope, receive, send):
+    if scope["type"] == "http":
+        await handle_http(scope, receive, send)
+    elif scope["type"] == "lifespan":
+        await handle_lifespan(scope, receive, send)
+
+# The ASGI server imports this module and then serves application.
+main()
@@ -0,0 +1,96 @@
+# Generates the schedule pages in benchmarks/fixtures.
+# They mimic the FullCalendar (scheduler, timeline view) markup of the official schedule pages, so that the parser
+# can be checked and measured without Selenium and without the university website.
+# Run from the APIs directory: python3 benchmarks/make_fixtures.py
+from random import Random
+from os import path, makedirs
+
+FIXTURES_DIR = path.join(path.dirname(path.abspath(__file__)), "fixtures")
+
+COURSES = ["Analisi matematica I", "Fisica generale & laboratorio", "Algebra lineare", "Programmazione e algoritmica",
+           "Chimica organica", "Basi di dati", "Diritto privato", "Economia aziendale", "Storia medievale", "Statistica"]
+TEACHERS = ["Rossi Mario", "Bianchi Anna", "Verdi Luca", "Neri Giulia", "Gialli Paolo", "Russo Sara"]
+
+# Returns the <a> tag of a schedule, variant changes the markup inside the spans.
+def schedule_a(rng, start, end, variant):
+    time = f"{start // 60:02d}:{start % 60:02d} - {end // 60:02d}:{end % 60:02d}"
+    course = rng.choice(COURSES).replace("&", "&amp;")
+    teacher = rng.choice(TEACHERS)
+    degree = f"Corso di laurea {rng.randint(1, 40)}"
+    if variant == "markup":
+        # Nested tags, entities and indentation between the rows.
+        title = f"{course}<br>\n\t\t<b>{teacher}</b><br>\t{degree} &lt;{rng.randint(1, 3)}&gt;\n\t"
+    elif variant == "plain":
+        # Title without <br>, a single row.
+        title = f"{course} - {teacher}"
+    else:
+        title = f"{course}<br>{teacher}<br>\t{degree}"
+    return (
+        '<a class="fc-timeline-event fc-h-event fc-event fc-start fc-end" style="left: 0px; right: 0px;">'
+        f'<div class="fc-content"><span class="fc-time">{time}</span><span class="fc-title">{title}</span></div>'
+        '<div class="fc-resizer fc-end-resizer"></div></a>'
+    )
+
+# Returns the whole page with rooms classrooms, empty_ratio of them without schedules.
+def schedule_page(seed, rooms, empty_ratio = 0.1, variant = "default"):
+    rng = Random(seed)
+    resource_rows = []
+    time_rows = []
+    for i in range(rooms):
+        resource_id = f"{rng.randint(100000, 999999)}_{i}"
+        name = f"Aula {chr(65 + i % 26)}{i // 26 + 1}"
+        resource_rows.append(
+            f'<tr data-resource-id="{resource_id}"><td class="fc-widget-content"><div><span class="fc-expander-space">'
+            f'<span class="fc-icon"></span></span><span class="fc-cell-text">{name} ({rng.randint(20, 300)} posti)</span>'
+            '</div></td></tr>'
+        )
+
+        events = []
+        if rng.random() >= empty_ratio:
+            minute = 8 * 60
+            while True:
+                minute += rng.choice([0, 0, 30, 60, 120])
+                duration = rng.choice([60, 90, 120, 180])
+                if minute + duration > 20 * 60:
+                    break
+                events.append(schedule_a(rng, minute, minute + duration, variant))
+                # Overlapping schedules in the same classroom, the next one starting before this one ends.
+                minute += duration // 2 if variant == "overlapping" else duration
+        time_rows.append(
+            f'<tr data-resource-id="{resource_id}"><td class="fc-widget-content"><div style="height: 34px;">'
+            f'<div class="fc-event-container">{"".join(events)}</div></div></td></tr>'
+        )
+
+    slats = "".join(f'<td data-date="T{hour:02d}:00:00" class="fc-widget-content"></td>' for hour in range(8, 20))
+    return f"""<!DOCTYPE html><html lang="it"><head><meta charset="utf-8"><title>Aule</title>
+<script>var calendarOptions = {{"defaultView": "timelineDay", "resourceAreaWidth": "25%"}};</script>
+<style>.fc-event {{ color: #fff; }}</style></head>
+<body><div class="entry-content"><div id="calendar" class="fc fc-unthemed fc-ltr">
+<div class="fc-toolbar fc-header-toolbar"><div class="fc-left"><h2>Orario aule</h2></div></div>
+<div class="fc-view-container"><div class="fc-view fc-timelineDay-view fc-timeline"><table><thead class="fc-head"><tr>
+<td class="fc-resource-area fc-widget-header"><div class="fc-scroller-clip"><table><tbody><tr><th class="fc-widget-header"><div><span class="fc-cell-text">Aule</span></div></th></tr></tbody></table></div></td>
+<td class="fc-divider fc-col-resizer fc-widget-header"></td>
+<td class="fc-time-area fc-widget-header"><div class="fc-scroller-clip"><table><tbody><tr>{slats}</tr></tbody></table></div></td>
+</tr></thead><tbody class="fc-body"><tr>
+<td class="fc-resource-area fc-widget-content"><div class="fc-scroller-clip"><div class="fc-scroller"><div class="fc-scroller-canvas"><div class="fc-content"><div class="fc-rows"><table><tbody>{"".join(resource_rows)}</tbody></table></div></div></div></div></div></td>
+<td class="fc-divider fc-col-resizer fc-widget-header"></td>
+<td class="fc-time-area fc-widget-content"><div class="fc-scroller-clip"><div class="fc-scroller"><div class="fc-scroller-canvas"><div class="fc-content"><div class="fc-rows"><table><tbody>{"".join(time_rows)}</tbody></table></div></div><div class="fc-bg"><div class="fc-slats"><table><tbody><tr>{slats}</tr></tbody></table></div></div></div></div></div></td>
+</tr></tbody></table></div></div></div></div></body></html>
+"""
+
+FIXTURES = {
+    "small_pole.html": lambda: schedule_page(1, 6),
+    "large_pole.html": lambda: schedule_page(2, 150),
+    "mostly_free_pole.html": lambda: schedule_page(3, 40, empty_ratio = 0.8),
+    "markup_pole.html": lambda: schedule_page(4, 30, variant = "markup"),
+    "plain_titles_pole.html": lambda: schedule_page(5, 30, variant = "plain"),
+    "overlapping_pole.html": lambda: schedule_page(6, 40, variant = "overlapping"),
+    "empty_pole.html": lambda: schedule_page(7, 20, empty_ratio = 1.0),
+}
+
+if __name__ == "__main__":
+    makedirs(FIXTURES_DIR, exist_ok = True)
+    for name, page in FIXTURES.items():
+        with open(path.join(FIXTURES_DIR, name), "w", encoding = "utf-8") as f:
+            f.write(page())
+        print(f"Written {name}.")
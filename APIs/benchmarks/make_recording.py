@@ -0,0 +1,44 @@
+# Generates a synthetic recording (see RECORD AND REPLAY in apis.py): poles with as many classrooms as wanted, to load
+# test the refresh and the APIs with the "replay" backend or with replay_server.py, without the university website.
+# Run from the APIs directory:
+# python3 benchmarks/make_recording.py RECORDING_DIR [--poles 10] [--rooms 1000] [--days 2]
+from sys import argv, path as sys_path, exit
+from os import path, environ
+from datetime import date, timedelta
+from html import escape
+
+BENCHMARKS_DIR = path.dirname(path.abspath(__file__))
+sys_path.insert(0, path.dirname(BENCHMARKS_DIR))
+
+# Only the recording functions are used.
+environ["SCHEDULES_STORE_PATH"] = ""
+import apis
+from make_fixtures import schedule_page
+
+def option(name, default) -> int:
+    return int(argv[argv.index(name) + 1]) if name in argv else default
+
+def poles_page(poles) -> str:
+    items = "".join(f'<li><a href="{escape(pole_link)}">{escape(pole_name)}</a></li>' for pole_name, pole_link in poles)
+    return f'<!DOCTYPE html><html lang="it"><body><div class="entry-content"><ul>{items}</ul></div></body></html>\n'
+
+def main():
+    if len(argv) < 2 or argv[1].startswith("--"):
+        print("Usage: python3 benchmarks/make_recording.py RECORDING_DIR [--poles 10] [--rooms 1000] [--days 2]")
+        exit(1)
+    apis.SCRAPE_RECORD_DIR = argv[1]
+    poles_count = option("--poles", 10)
+    rooms = option("--rooms", 1000)
+    days = option("--days", 2)
+
+    poles = [(f"Polo sintetico {i + 1}", f"https://synthetic.invalid/polo-sintetico-{i + 1}/") for i in range(poles_count)]
+    apis.record_poles_page(poles_page(poles).encode("utf-8"))
+    today = date.today()
+    for i, (pole_name, pole_link) in enumerate(poles):
+        for day in range(days):
+            # Different schedules for each pole and day.
+            apis.record_schedule_page(pole_link, today + timedelta(days = day), schedule_page(1000 * i + day, rooms))
+        print(f"Recorded {pole_name}, {rooms} classrooms, {days} days.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+# Checks that escrape_schedule_page gives the same output of the BeautifulSoup reference implementation
+# on the saved pages in benchmarks/fixtures, and compares their timings.
+# Run from the APIs directory: python3 benchmarks/parser_parity.py [page.html ...]
+from sys import argv, path as sys_path, exit
+from os import path, listdir, environ
+from time import perf_counter
+
+BENCHMARKS_DIR = path.dirname(path.abspath(__file__))
+sys_path.insert(0, path.dirname(BENCHMARKS_DIR))
+
+# Only the parser is used: no shared store and no slow requests log, nothing is written on disk.
+environ["SCHEDULES_STORE_PATH"] = ""
+environ["SLOW_REQUESTS_LOG_PATH"] = ""
+
+from apis import escrape_schedule_page
+from reference_parser import escrape_schedule_page_reference
+
+FIXTURES_DIR = path.join(BENCHMARKS_DIR, "fixtures")
+RUNS = 5
+MAX_PRINTED_ERRORS = 5
+
+# The reference joins back the parsed text of a schedule by the first 20 characters of its plain text, so when
+# two different schedules share them it can give to one the text of the other. Those are not parity errors.
+def aliased_prefixes(infos):
+    texts = {}
+    for info in infos:
+        for schedule in info[list(info.keys())[1]]:
+            texts.setdefault(schedule.replace("|", "")[0:20], set()).add(schedule)
+    return {prefix for prefix, schedules in texts.items() if len(schedules) > 1}
+
+# Returns (errors, aliased schedules) comparing the two outputs.
+def compare(reference, fast):
+    if reference is None or fast is None:
+        return (0 if reference is None and fast is None else 1), 0
+    if len(reference) != len(fast):
+        return 1, 0
+
+    aliased = aliased_prefixes(fast)
+    errors = 0
+    aliased_count = 0
+    for info_reference, info_fast in zip(reference, fast):
+        if list(info_reference.keys()) != list(info_fast.keys()) or info_reference["Classroom"] != info_fast["Classroom"]:
+            errors += 1
+            continue
+        row_id = list(info_fast.keys())[1]
+        if len(info_reference[row_id]) != len(info_fast[row_id]):
+            errors += 1
+            continue
+        for schedule_reference, schedule_fast in zip(info_reference[row_id], info_fast[row_id]):
+            if schedule_reference == schedule_fast:
+                continue
+            if schedule_fast.replace("|", "")[0:20] in aliased:
+                aliased_count += 1
+            else:
+                errors += 1
+                if errors <= MAX_PRINTED_ERRORS:
+                    print(f"  {info_fast['Classroom']}: {schedule_reference!r} != {schedule_fast!r}")
+    return errors, aliased_count
+
+# Best of RUNS, in milliseconds.
+def timing(function, source):
+    best = None
+    for _ in range(RUNS):
+        start = perf_counter()
+        function(source)
+        elapsed = (perf_counter() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def main():
+    pages = argv[1:] or [path.join(FIXTURES_DIR, name) for name in sorted(listdir(FIXTURES_DIR)) if name.endswith(".html")]
+
+    failed = False
+    print(f"{'page':<28}{'classrooms':>11}{'errors':>8}{'aliased':>9}{'reference ms':>14}{'fast ms':>10}{'speedup':>9}")
+    for page in pages:
+        with open(page, encoding = "utf-8") as f:
+            source = f.read()
+
+        reference = escrape_schedule_page_reference(source)
+        fast = escrape_schedule_page(source)
+        errors, aliased = compare(reference, fast)
+        failed = failed or errors > 0
+
+        reference_ms = timing(escrape_schedule_page_reference, source)
+        fast_ms = timing(escrape_schedule_page, source)
+        classrooms = len(fast) if fast is not None else 0
+        print(f"{path.basename(page):<28}{classrooms:>11}{errors:>8}{aliased:>9}{reference_ms:>14.1f}{fast_ms:>10.1f}{reference_ms / fast_ms:>8.1f}x")
+
+    exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+# The BeautifulSoup implementation of escrape_schedule_page, as it was before the single pass parser.
+# Kept only as the reference for benchmarks/parser_parity.py, the APIs don't use it.
+from bs4 import BeautifulSoup
+
+from typing import List, Dict, Optional, Union
+
+# Returns an "infos" list, with the following structure:
+# [
+#   {"Classroom": "classroom_name", "RESOURCE_ID_ROW_DYNAMIC": ["schedule1", "schedule2", ...]},
+#   ...
+# ]
+# Where scheduleN is all the plain text in the <a> tag as str with each <br> row delimited by an '|'.
+def escrape_schedule_page_reference(schedule_page_source) -> Optional[List[Dict[str, Union[str, List[str]]]]]:
+
+    soup = BeautifulSoup(schedule_page_source, 'html.parser')
+
+    # The page is divided in two parts (tables).
+    # The first one is a table with as rows the classrooms, each table row has a classroom's name.
+    # The second one is a table with as rows the schedules.
+
+    # The schedules could be from 0 to n. 0 means the classroom is free all day.
+    # Since the content of interest is divided in two tables, we need to iterate over both of them and match the classrooms with the schedules manually.
+
+    # ATTENTION: BE CAREFUL, NOT ALL POLES PAGE HAVE THE SAME STRUCTURE, SO BE AS GENERIC AS POSSIBLE.
+
+    # [
+    #   {"Classroom": "classroom_name", "RESOURCE_ID_ROW_DYNAMIC": ["schedule1", "schedule2", ...]},
+    #   ...
+    # ]
+    # Where scheduleN is all the plain text in the <a> tag as str with each <br> row delimited by an '|'.
+    infos: List[Dict[str, Union[str, List[str]]]] = []
+
+    # Iterating over the first table to get the classrooms.
+    first_table = soup.find_all("td", class_=["fc-resource-area fc-widget-content"])[0]
+    rows_first = first_table.find_all("td", class_=["fc-widget-content"])
+
+    # List of classrooms' names as str.
+    classrooms: List[str] = []
+    for row in rows_first:
+        # Sanitizing the classroom name.
+        classroom = row.text.split("(")[0].strip()
+        classrooms.append(classroom)
+
+    # Getting second table's data.
+    second_table = soup.find_all("td", class_=["fc-time-area fc-widget-content"])[0]
+    all_schedules_a = second_table.find_all("a")
+    parsed_a = ""
+    all_parsed_a = []
+    for a in all_schedules_a:
+        spans = a.find_all("span")
+        for s in spans:
+            brs = s.find_all("br")
+            if len(brs) > 0:
+                content = s.decode_contents()
+                lines = [line.strip().replace("\t", "") for line in content.split("<br/>") if line.strip()]
+                parsed_a += "|".join(lines)
+            else:
+                parsed_a += s.text + "|"
+
+        all_parsed_a.append(parsed_a)
+        parsed_a = ""
+    rows_second = second_table.find_all("table")[0].find_all("tr")
+
+    # DANGER IF THE TABLES ARE NOT IN SYNC.
+    if len(rows_first) != len(rows_second):
+        return None
+
+    # Getting rows' ids, used to join the classrooms with the schedules.
+    # data-resource-id is an attribute of the <tr> tag.
+    rows_ids = []
+    for row in rows_second:
+        rows_ids.append(row['data-resource-id'])
+
+    # Getting schedules.
+    # list_of_schedules is the final list.
+    list_of_schedules = []
+    current_row_id = ""
+    # current_row_schedules is a TEMPORARY list of schedules of the current row.
+    current_row_schedules = []
+    # Adding a None to the end to process the last row, otherwise it will be skipped wrongly.
+    for schedule_a in list(all_schedules_a) + [None]:
+
+        if schedule_a is None:
+            # Last iteration.
+            # current_row_schedules is not empty, setted in the previous iteration.
+            info = {}
+            info[current_row_id] = current_row_schedules.copy()
+
+            list_of_schedules.append(info)
+
+            current_row_schedules.clear()
+
+            break
+
+        schedule = schedule_a.text
+
+        # We need to navigate the DOM to get the parent <tr> tag and the associated data-resource-id.
+        # data-resource-id is an attribute of the <tr> tag.
+        tr_parent = schedule_a.find_parent("tr")
+        tr_parent_id = tr_parent['data-resource-id']
+
+        if current_row_id == "":
+            # First iteration.
+            current_row_id = tr_parent_id
+            # The process of the first row is skipped, balanced by the last iteration.
+        else:
+            if current_row_id != tr_parent_id:
+                # New row's id.
+                info = {}
+                info[current_row_id] = current_row_schedules.copy()
+                list_of_schedules.append(info)
+
+                current_row_schedules.clear()
+
+                current_row_id = tr_parent_id
+
+        current_row_schedules.append(schedule)
+
+    # Joining all the infos.
+    for i in range(len(list(rows_second))):
+        row = rows_second[i]
+
+        info = {}
+        info["Classroom"] = classrooms[i]
+        # Initializing the list of schedules.
+        info[rows_ids[i]] = []
+        for schedule in list_of_schedules:
+            if rows_ids[i] in schedule:
+                info[rows_ids[i]] = schedule[rows_ids[i]]
+                break
+
+        infos.append(info)
+
+    # Replacing unparsed a datas with parsed one.
+    unparsed_tmp = [e.replace("|", "") for e in all_parsed_a]
+    for classroom in infos:
+        rsid = list(classroom.keys())[1]
+        schedules = classroom[rsid]
+        for counter in range(len(schedules)):
+            cu = 0
+            for u in unparsed_tmp:
+                if schedules[counter].startswith(u[0:20]):
+                    schedules[counter] = all_parsed_a[cu].replace("&amp;", "")
+                    break
+                cu += 1
+
+    return infos
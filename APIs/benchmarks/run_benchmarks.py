@@ -0,0 +1,188 @@
+# Times the hot paths on the saved pages in benchmarks/fixtures, without Selenium and without the university website:
+# parsing, model building, free classrooms computation, the endpoints through Flask's test client, one request at a
+# time and with concurrent clients. Then compares the results with benchmarks/baseline.json.
+# Run from the APIs directory:
+# python3 benchmarks/run_benchmarks.py                  compares with the baseline, exits 1 on regressions
+# python3 benchmarks/run_benchmarks.py --save-baseline  saves the results as the new baseline
+# python3 benchmarks/run_benchmarks.py --tolerance 3    regression if slower than 3 times the baseline (default 2)
+from sys import argv, path as sys_path, exit
+from os import path, listdir, environ
+from time import perf_counter
+from statistics import median
+from concurrent.futures import ThreadPoolExecutor
+import json
+
+BENCHMARKS_DIR = path.dirname(path.abspath(__file__))
+sys_path.insert(0, path.dirname(BENCHMARKS_DIR))
+
+# No shared store and no slow requests log: the caches are filled below and nothing is written on disk.
+environ["SCHEDULES_STORE_PATH"] = ""
+environ["SLOW_REQUESTS_LOG_PATH"] = ""
+import apis
+
+FIXTURES_DIR = path.join(BENCHMARKS_DIR, "fixtures")
+BASELINE_PATH = path.join(BENCHMARKS_DIR, "baseline.json")
+RUNS = 11
+REQUESTS_RUNS = 200
+CONCURRENT_CLIENTS = 16
+CONCURRENT_REQUESTS_PER_CLIENT = 50
+# Timings under this are too noisy to be compared with the baseline.
+MIN_COMPARED_MS = 0.05
+
+# Best of RUNS of function(), in milliseconds.
+def best_ms(function, runs = RUNS):
+    best = None
+    for _ in range(runs):
+        start = perf_counter()
+        function()
+        elapsed = (perf_counter() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+# Loads every fixture as a pole named "Bench <fixture name>", with the scrapes answered from the fixtures.
+def load_poles():
+    sources = {}
+    for name in sorted(listdir(FIXTURES_DIR)):
+        if name.endswith(".html"):
+            with open(path.join(FIXTURES_DIR, name), encoding = "utf-8") as f:
+                sources[name[:-len(".html")]] = f.read()
+
+    poles = [{f"Bench {name}": f"http://benchmarks/{name}"} for name in sources]
+    apis.fetch_poles_data = lambda: poles
+    apis.selenium_get_schedule_page = lambda pole_link, *args, **kwargs: sources.get(pole_link.rsplit("/", 1)[1])
+    apis.is_refresher = True
+    apis.swap_poles_directory(apis.build_poles_directory(poles))
+    for name, source in sources.items():
+        apis.update_pole_cache(f"http://benchmarks/{name}", source)
+    return sources
+
+def bench_parsing(sources):
+    results = {}
+    for name, source in sources.items():
+        infos = apis.escrape_schedule_page(source)
+        results[f"parse/{name}"] = best_ms(lambda: apis.escrape_schedule_page(source))
+        results[f"build_model/{name}"] = best_ms(lambda: apis.build_pole_schedules_from_infos("http://benchmarks/" + name, infos))
+    return results
+
+# Free classrooms of each pole at every quarter of hour of the teaching day.
+def bench_free_classrooms(sources):
+    results = {}
+    minutes = range(8 * 60, 20 * 60, 15)
+    for name in sources:
+        pole_schedules = apis.get_pole_schedules(f"http://benchmarks/{name}")
+        results[f"free_classrooms_day/{name}"] = best_ms(lambda: [apis.get_free_classrooms_at(pole_schedules.classrooms, minute) for minute in minutes])
+    return results
+
+def endpoints(name, pole_schedules):
+    pole = f"Bench {name}"
+    classroom = pole_schedules.classrooms[0].name if pole_schedules.classrooms else "none"
+    return {
+        "all_rooms": f"/api/get_all_rooms_given_pole?pole_name={pole}",
+        "free_now": f"/api/free_classrooms_now_given_pole?pole_name={pole}",
+        "free_at": f"/api/free_classrooms_at_given_pole?pole_name={pole}&time=11:00&minutes=60",
+        "all_schedules": f"/api/all_schedules_given_pole_and_room?pole_name={pole}&classroom={classroom}",
+        "current": f"/api/current_schedule_given_pole_and_room?pole_name={pole}&classroom={classroom}",
+        "free_slots": f"/api/free_slots_given_pole_and_room?pole_name={pole}&classroom={classroom}&time=08:00",
+        "batch": f"/api/batch_given_poles?pole_name={pole}&facets=rooms,free_now,current,schedules",
+        "free_all_poles": "/api/free_classrooms_at_all_poles?time=11:00&minutes=60",
+    }
+
+# Median latency of each endpoint, one request at a time.
+def bench_endpoints(sources):
+    client = apis.app.test_client()
+    results = {}
+    for name in ["small_pole", "large_pole"]:
+        if name not in sources:
+            continue
+        for endpoint, url in endpoints(name, apis.get_pole_schedules(f"http://benchmarks/{name}")).items():
+            client.get(url)
+            latencies = []
+            for _ in range(REQUESTS_RUNS):
+                start = perf_counter()
+                response = client.get(url)
+                latencies.append((perf_counter() - start) * 1000)
+                if response.status_code != 200:
+                    print(f"{url}: status {response.status_code}")
+            results[f"endpoint/{endpoint}/{name}"] = median(latencies)
+    return results
+
+# CONCURRENT_CLIENTS clients, each with its own test client, requesting all the endpoints of all the poles.
+# Returns the p50 and p95 latencies and the total throughput.
+def bench_concurrency(sources):
+    urls = []
+    for name in sources:
+        urls += endpoints(name, apis.get_pole_schedules(f"http://benchmarks/{name}")).values()
+
+    def client_run(i):
+        client = apis.app.test_client()
+        latencies = []
+        for j in range(CONCURRENT_REQUESTS_PER_CLIENT):
+            url = urls[(i * CONCURRENT_REQUESTS_PER_CLIENT + j) % len(urls)]
+            start = perf_counter()
+            client.get(url)
+            latencies.append((perf_counter() - start) * 1000)
+        return latencies
+
+    start = perf_counter()
+    with ThreadPoolExecutor(max_workers = CONCURRENT_CLIENTS) as executor:
+        latencies = sorted(latency for client_latencies in executor.map(client_run, range(CONCURRENT_CLIENTS)) for latency in client_latencies)
+    elapsed = perf_counter() - start
+    return {
+        "concurrent/p50": latencies[len(latencies) // 2],
+        "concurrent/p95": latencies[int(len(latencies) * 0.95)],
+        # Not a time, compared the other way around.
+        "concurrent/requests_per_second": len(latencies) / elapsed,
+    }
+
+# Returns the regressions, [(name, baseline, result)], results slower than tolerance times the baseline.
+def compare(results, baseline, tolerance):
+    regressions = []
+    for name, value in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        if name.endswith("requests_per_second"):
+            if value * tolerance < base:
+                regressions.append((name, base, value))
+        elif max(value, base) >= MIN_COMPARED_MS and value > base * tolerance:
+            regressions.append((name, base, value))
+    return regressions
+
+def main():
+    tolerance = 2.0
+    if "--tolerance" in argv:
+        tolerance = float(argv[argv.index("--tolerance") + 1])
+
+    sources = load_poles()
+    results = {}
+    results.update(bench_parsing(sources))
+    results.update(bench_free_classrooms(sources))
+    results.update(bench_endpoints(sources))
+    results.update(bench_concurrency(sources))
+
+    baseline = {}
+    if path.exists(BASELINE_PATH):
+        with open(BASELINE_PATH, encoding = "utf-8") as f:
+            baseline = json.load(f)
+
+    print(f"{'benchmark':<52}{'baseline':>12}{'result':>12}{'ratio':>8}")
+    for name, value in results.items():
+        base = baseline.get(name)
+        ratio = f"{value / base:>7.2f}x" if base else f"{'':>8}"
+        print(f"{name:<52}{'' if base is None else f'{base:.3f}':>12}{value:>12.3f}{ratio}")
+    print("Times in milliseconds, requests_per_second in requests per second.")
+
+    if "--save-baseline" in argv:
+        with open(BASELINE_PATH, "w", encoding = "utf-8") as f:
+            json.dump({name: round(value, 4) for name, value in results.items()}, f, indent = 2, sort_keys = True)
+            f.write("\n")
+        print(f"Baseline saved in {BASELINE_PATH}.")
+        exit(0)
+
+    regressions = compare(results, baseline, tolerance)
+    for name, base, value in regressions:
+        print(f"Regression: {name} {base:.3f} -> {value:.3f}")
+    exit(1 if regressions else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,7 @@
+from apis import *
+
+# Scrapes the poles and keeps the shared schedules store (SCHEDULES_STORE_PATH) updated, without serving the APIs.
+# Used when all the gunicorn workers run with SCHEDULES_ROLE=reader.
+if __name__ == "__main__":
+
+    run_refresher()
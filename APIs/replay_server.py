@@ -0,0 +1,102 @@
+from sys import argv, exit
+from os import path, listdir
+from datetime import date
+from hashlib import sha1
+from html import unescape
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+from time import sleep
+import re
+
+# Stand-in of the university website, serves a recording (see RECORD AND REPLAY in apis.py) over HTTP, so that the
+# whole refresh and serving pipeline can be load tested without network and Chrome.
+# The poles page links are rewritten to this server, the schedule pages are served already rendered and the day is
+# the date query arg (what the "http" backend sends), today is the recording day.
+# python3 replay_server.py RECORDING_DIR [--port 8001] [--delay SECONDS]
+# Then run the APIs with:
+# SCRAPER_BACKEND=http POLES_DATA_URL=http://127.0.0.1:8001/poli-didattici/ python3 -m gunicorn ... wsgi:app
+# --delay waits before each answer, to simulate the university website latency.
+
+POLES_PATH = "/poli-didattici/"
+POLE_PATH = "/pole/"
+HREF_REGEX = re.compile(r'href="([^"]*)"')
+
+# Same as recording_pole_key in apis.py, not imported to keep this server free of the APIs startup.
+def recording_pole_key(pole_link) -> str:
+    return sha1(pole_link.encode("utf-8")).hexdigest()[:16]
+
+class RecordingHandler(BaseHTTPRequestHandler):
+    recording_dir = ""
+    delay_seconds = 0.0
+
+    def do_GET(self):
+        if self.delay_seconds > 0:
+            sleep(self.delay_seconds)
+        url = urlsplit(self.path)
+        if url.path == POLES_PATH:
+            self.send_poles_page()
+        elif url.path.startswith(POLE_PATH):
+            self.send_schedule_page(url.path[len(POLE_PATH):], parse_qs(url.query).get("date", [""])[0])
+        else:
+            self.send_content(404, b"Not found.")
+
+    def send_content(self, status, content: bytes):
+        self.send_response(status)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    # The recorded poles page, with the links of the recorded poles pointing to this server.
+    def send_poles_page(self):
+        try:
+            with open(path.join(self.recording_dir, "poles.html"), encoding = "utf-8") as f:
+                page = f.read()
+        except OSError:
+            self.send_content(404, b"No poles page recorded.")
+            return
+
+        recorded = {name.rsplit("_", 1)[0] for name in listdir(path.join(self.recording_dir, "pages")) if name.endswith(".html")}
+        base = f"http://{self.headers.get('Host', 'localhost')}{POLE_PATH}"
+
+        def rewrite(match):
+            key = recording_pole_key(unescape(match.group(1)))
+            return f'href="{base}{key}"' if key in recorded else match.group(0)
+
+        self.send_content(200, HREF_REGEX.sub(rewrite, page).encode("utf-8"))
+
+    def send_schedule_page(self, key, day):
+        days = 0
+        if day:
+            try:
+                days = (date.fromisoformat(day) - date.today()).days
+            except ValueError:
+                self.send_content(400, b"Invalid date.")
+                return
+        try:
+            with open(path.join(self.recording_dir, "pages", f"{path.basename(key)}_{days}.html"), "rb") as f:
+                content = f.read()
+        except OSError:
+            self.send_content(404, b"No page recorded for this pole and day.")
+            return
+        self.send_content(200, content)
+
+    # Quiet, a load test makes a line per request.
+    def log_message(self, format, *args):
+        pass
+
+def main():
+    if len(argv) < 2 or not path.isfile(path.join(argv[1], "recording.json")):
+        print("Usage: python3 replay_server.py RECORDING_DIR [--port 8001] [--delay SECONDS]")
+        exit(1)
+    RecordingHandler.recording_dir = argv[1]
+    port = int(argv[argv.index("--port") + 1]) if "--port" in argv else 8001
+    if "--delay" in argv:
+        RecordingHandler.delay_seconds = float(argv[argv.index("--delay") + 1])
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), RecordingHandler)
+    print(f"Serving {argv[1]} at http://127.0.0.1:{port}{POLES_PATH}")
+    server.serve_forever()
+
+if __name__ == "__main__":
+    main()